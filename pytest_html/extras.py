@@ -2,6 +2,9 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import mimetypes
+import os
+
 FORMAT_HTML = 'html'
 FORMAT_IMAGE = 'image'
 FORMAT_JSON = 'json'
@@ -14,6 +17,39 @@ def extra(content, format, name=None, mime_type=None, extension=None):
             'mime_type': mime_type, 'extension': extension}
 
 
+def deferred(source):
+    """Defer getting the content until it's known to be needed.
+
+    The source is either a function that returns the content, or the path of
+    a file to read it from. It can be used as the content of any of the other
+    types, e.g. ``text(deferred('browser.log'))``, and is only resolved for
+    the tests with one of the outcomes given to ``--html-deferred-extras``.
+    """
+    if callable(source):
+        return source
+    return {'deferred_path': os.path.abspath(source)}
+
+
+def file(path, name='File', mime_type=None, extension=None):
+    """Attach a file to the report, without reading it into memory.
+
+    Only the path is recorded. Once the report is generated, the file is
+    linked into its assets directory (or copied, if it can't be), or embedded
+    for a self-contained report. Images are shown like any other, and other
+    files are linked to.
+    """
+    if mime_type is None:
+        mime_type = mimetypes.guess_type(path)[0]
+    if extension is None:
+        extension = os.path.splitext(path)[1].lstrip('.') or None
+    if mime_type is not None and mime_type.startswith('image/'):
+        format = FORMAT_IMAGE
+    else:
+        format = FORMAT_URL
+    return extra({'file_path': os.path.abspath(path)}, format, name,
+                 mime_type, extension)
+
+
 def html(content):
     return extra(content, FORMAT_HTML)
 
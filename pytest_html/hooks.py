@@ -9,3 +9,7 @@ def pytest_html_results_summary(summary):
 
 def pytest_html_add_node_chain_extra(item, outcome, extra, node_chain):
     """ Called after each test is run, but before generating any HTML. """
+
+
+def pytest_html_collect_node_extras(node, tests):
+    """ Called once all the tests in a node of the node chain are done. """
@@ -4,18 +4,27 @@
 
 from __future__ import absolute_import
 
+from array import array
 from base64 import b64encode, b64decode
 from collections import OrderedDict
+from io import BytesIO
 from os.path import isfile
 import datetime
 import json
 import os
 import pkg_resources
 import sys
+import threading
 import time
+import traceback
 import bisect
+import gzip
 import hashlib
+import heapq
+import multiprocessing
+import shutil
 import warnings
+import zlib
 
 import pytest
 from execnet.gateway_base import _Serializer
@@ -27,10 +36,39 @@ except ImportError:
     # ansi2html is not installed
     ANSI = False
 
+try:
+    import brotli
+    BROTLI = True
+except ImportError:
+    # brotli is not installed
+    BROTLI = False
+
+try:
+    import orjson
+    ORJSON = True
+except ImportError:
+    # orjson is not installed
+    ORJSON = False
+
+try:
+    import ujson
+    UJSON = True
+except ImportError:
+    # ujson is not installed
+    UJSON = False
+
+try:
+    from PIL import Image
+    PILLOW = True
+except ImportError:
+    # Pillow is not installed
+    PILLOW = False
+
 from py.xml import html, raw
 
 from . import extras
 from . import __version__, __pypi_url__
+from .store import ResultsStore
 
 PY3 = sys.version_info[0] == 3
 
@@ -38,9 +76,13 @@ PY3 = sys.version_info[0] == 3
 if PY3:
     basestring = str
     from html import escape
+    from queue import Queue
+    from concurrent.futures import ProcessPoolExecutor
 else:
     from codecs import open
     from cgi import escape
+    from Queue import Queue
+    ProcessPoolExecutor = None
 
 
 def pytest_addhooks(pluginmanager):
@@ -67,11 +109,148 @@ def pytest_addoption(parser):
                     help='do not group tests by their xdist worker, like they '
                     'would be grouped for things like packages, modules, and '
                     'classes.')
+    group.addoption('--html-compress', action='store', dest='html_compress',
+                    choices=sorted(COMPRESSION_SUFFIXES), default=None,
+                    help='compress the report, and its style sheet and '
+                    'script, while they are being written. The compressed '
+                    'files are written instead of the plain ones, with the '
+                    'matching suffix appended to their names (e.g. '
+                    'report.html.gz). Spooled logs, lazy payloads and files '
+                    'are not compressed.')
+    group.addoption('--html-compress-payload', action='store_true',
+                    help='embed the test results in the report as a '
+                    'compressed, base64 encoded blob that is only inflated '
+                    'by the browser when the report is opened. This mostly '
+                    'benefits self-contained reports, as the results make up '
+                    'most of their size.')
+    group.addoption('--html-lazy-payload', action='store_true',
+                    help='write the logs and extras of the tests to separate '
+                    'files (one per module) in the assets directory, which '
+                    'the report only loads once the tests are shown. This '
+                    'has no effect when creating a self-contained report.')
+    group.addoption('--html-payload-format', action='store',
+                    dest='html_payload_format',
+                    choices=('nested', 'interned', 'columnar'),
+                    default='nested',
+                    help='format of the test results embedded in the report. '
+                    '"nested" mirrors the structure of the results, '
+                    '"interned" does as well, but stores repeated strings '
+                    'only once in a shared table, while "columnar" flattens '
+                    'it into parallel arrays, which is quicker to produce and '
+                    'to load for large test suites, but does not support '
+                    '--html-lazy-payload. (default: nested)')
+    group.addoption('--html-json-backend', action='store',
+                    dest='html_json_backend',
+                    choices=('auto', 'orjson', 'ujson', 'json'),
+                    default='auto',
+                    help='library used to serialize the test results '
+                    'embedded in the report. "auto" uses the fastest one '
+                    'that is installed, in the order: orjson, ujson, and the '
+                    'json module of the standard library. (default: auto)')
+    group.addoption('--html-deferred-extras', action='store',
+                    dest='html_deferred_extras', metavar='outcomes',
+                    default='failed,error',
+                    help='comma separated outcomes of the tests that '
+                    'deferred extra content (i.e. functions, or files given '
+                    'with extras.deferred) is resolved for, e.g. '
+                    '"failed,error,xpassed", or "all". For the other tests, '
+                    'it is dropped without being resolved. '
+                    '(default: failed,error)')
+    group.addoption('--html-thumbnail-size', action='store', type=int,
+                    dest='html_thumbnail_size', metavar='pixels',
+                    default=200,
+                    help='largest width and height of the thumbnails shown '
+                    'for images, instead of the full images, which are only '
+                    'shown in the slideshow. Requires the Pillow package, '
+                    'and 0 disables them. Self-contained reports have no '
+                    'thumbnails. (default: 200)')
+    group.addoption('--html-thumbnail-processes', action='store', type=int,
+                    dest='html_thumbnail_processes', metavar='num',
+                    default=None,
+                    help='number of processes the thumbnails are made in, '
+                    'when there are enough of them, 0 or 1 makes them without '
+                    'a pool. (default: the number of CPUs)')
+    group.addoption('--html-results-db', action='store',
+                    dest='html_results_db', metavar='path', default=None,
+                    help='also store the results in a SQLite database at the '
+                    'given path, which pytest-html-serve can serve a page at '
+                    'a time, for reports that are too large to open.')
+    group.addoption('--html-log-section-limit', action='store', type=int,
+                    dest='html_log_section_limit', metavar='chars',
+                    default=None,
+                    help='maximum number of characters shown for each part '
+                    'of the log of a test (i.e. its traceback, and each of '
+                    'its captured outputs). Longer parts only have their '
+                    'start and end shown, and, unless the report is '
+                    'self-contained, are written to the assets directory in '
+                    'full, and linked to.')
+    group.addoption('--html-log-limit', action='store', type=int,
+                    dest='html_log_limit', metavar='chars', default=None,
+                    help='maximum number of characters shown for the whole '
+                    'log of a test. Parts of the log that go over it are '
+                    'shortened the same way as with --html-log-section-limit.')
+    group.addoption('--html-render-thread', action='store_true',
+                    help='render the logs of the tests, and add them to the '
+                    'report, in a background thread, rather than between '
+                    'tests.')
+    group.addoption('--html-log-cache', action='store_true',
+                    help='keep the rendered logs of the tests in the pytest '
+                    'cache, so tests that produce the same output in a later '
+                    'run reuse them, rather than rendering them again.')
+    group.addoption('--html-log-cache-size', action='store', type=int,
+                    dest='html_log_cache_size', metavar='MB', default=100,
+                    help='maximum size of the rendered logs kept in the '
+                    'cache, the ones that were used the longest ago are '
+                    'removed first. (default: 100)')
+    group.addoption('--html-history', action='store_true',
+                    help='keep the durations and outcomes of the tests in '
+                    'the pytest cache, and compare the tests to how long they '
+                    'took in the previous runs, flagging those that got '
+                    'significantly slower.')
+    group.addoption('--html-history-runs', action='store', type=int,
+                    dest='html_history_runs', metavar='runs', default=10,
+                    help='number of previous runs kept in the history, '
+                    'tests that did not run in any of them are dropped from '
+                    'it. must be at least 1. (default: 10)')
 
 
 def pytest_configure(config):
+    # the nodes of the tree are looked up among the ones created so far, which
+    # mustn't include those of an earlier session run in the same process
+    SerializableNode._instances = []
+    SerializableParamFixInfo._instances = []
     htmlpath = config.getoption('htmlpath')
     if htmlpath:
+        compression = config.getoption('html_compress')
+        if compression == 'brotli' and not BROTLI:
+            raise pytest.UsageError(
+                "--html-compress=brotli requires the 'brotli' package",
+            )
+        json_backend = config.getoption('html_json_backend')
+        if not JSON_BACKENDS.get(json_backend, True):
+            raise pytest.UsageError(
+                "--html-json-backend={0} requires the '{0}' package".format(
+                    json_backend,
+                ),
+            )
+        unknown_outcomes = get_deferred_outcomes(config) - set(OUTCOMES)
+        if unknown_outcomes:
+            raise pytest.UsageError(
+                "--html-deferred-extras: unknown outcomes: {0}".format(
+                    ", ".join(sorted(unknown_outcomes)),
+                ),
+            )
+        if config.getoption('html_history_runs') < 1:
+            raise pytest.UsageError(
+                "--html-history-runs must be at least 1",
+            )
+        for option in ('html_log_cache', 'html_history'):
+            if config.getoption(option) and not hasattr(config, 'cache'):
+                raise pytest.UsageError(
+                    "--{0} requires the 'cacheprovider' plugin".format(
+                        option.replace('_', '-'),
+                    ),
+                )
         for csspath in config.getoption('css') or []:
             open(csspath)
         for jspath in config.getoption('js') or []:
@@ -94,6 +273,272 @@ def data_uri(content, mime_type='text/plain', charset='utf-8'):
     return 'data:{0};charset={1};base64,{2}'.format(mime_type, charset, data)
 
 
+def compress_payload(content):
+    """Deflate the text and encode it so it can be embedded in a script.
+
+    The zlib format is used, as that's what the browser's
+    ``DecompressionStream('deflate')`` expects to inflate.
+    """
+    return b64encode(zlib.compress(content.encode('utf-8'), 9)).decode('ascii')
+
+
+OUTCOMES = ("passed", "skipped", "failed", "error", "xfailed", "xpassed")
+PHASES = ("setup", "call", "teardown")
+# images to make thumbnails of before it's worth starting a pool of processes
+THUMBNAIL_POOL_MIN_IMAGES = 8
+# upper bounds (in seconds) of the buckets of the duration histograms, with one
+# more bucket for anything slower
+DURATION_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 25.0, 50.0, 100.0,
+)
+
+
+HISTORY_KEY = "pytest_html/history"
+
+
+def is_duration_regression(duration, history):
+    """Determine if the duration is significantly slower than the earlier ones.
+
+    At least three earlier durations are needed to tell. The duration has to be
+    more than three standard deviations above their mean, as well as half
+    again as slow as it (and slower by more than 10ms), so tests whose
+    duration varies a lot, or that hardly take any time at all, aren't flagged
+    just because of noise.
+    """
+    if len(history) < 3:
+        return False
+    mean = sum(history) / len(history)
+    variance = sum((d - mean) ** 2 for d in history) / (len(history) - 1)
+    return all((
+        duration > mean + 3 * variance ** 0.5,
+        duration > mean * 1.5,
+        duration - mean > 0.01,
+    ))
+
+
+def histogram_percentile(histogram, fraction):
+    """Estimate a percentile of the durations counted in the histogram.
+
+    Returns the upper bound of the bucket the percentile falls in, or ``None``
+    if it falls in the last bucket, which has none.
+    """
+    rank = fraction * sum(histogram)
+    count = 0
+    for bound, bucket_count in zip(DURATION_BUCKETS, histogram):
+        count += bucket_count
+        if count >= rank:
+            return bound
+    return None
+
+
+JSON_BACKENDS = OrderedDict((
+    ("orjson", ORJSON),
+    ("ujson", UJSON),
+    ("json", True),
+))
+
+
+def get_json_backend(name="auto"):
+    """Get the name of the JSON backend to use, the fastest one for auto."""
+    if name == "auto":
+        return next(n for n, available in JSON_BACKENDS.items() if available)
+    return name
+
+
+def json_dumps(value, backend="json", indent=False):
+    """Serialize the value to a JSON string with the given backend.
+
+    The values only have to be those all the backends can handle natively
+    (see ``to_json_value``), so none of them need a fallback for others.
+    """
+    if backend == "orjson":
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(value, option=option).decode("utf-8")
+    if backend == "ujson":
+        return ujson.dumps(value, indent=2 if indent else 0)
+    if indent:
+        return json.dumps(value, indent=2)
+    return json.dumps(value, separators=(",", ":"))
+
+
+def to_json_value(value):
+    """Convert the value to one every JSON backend can serialize natively.
+
+    Parameters of fixtures can be of any type ``execnet`` can serialize (e.g.
+    bytes, sets or complex numbers), but the JSON backends differ in what they
+    support beyond strings, numbers, booleans, lists and dicts, so anything
+    else is converted to a string.
+    """
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(v) for v in value]
+    if isinstance(value, dict):
+        return dict((str(k), to_json_value(v)) for k, v in value.items())
+    if value is None or isinstance(value, (basestring, bool, int, float)):
+        return value
+    return str(value)
+
+
+def pack_column(typecode, values):
+    """Pack the values as little-endian binary, and base64 encode them."""
+    column = array(typecode, values)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    if PY3:
+        data = column.tobytes()
+    else:
+        data = column.tostring()
+    return b64encode(data).decode('ascii')
+
+
+COMPRESSION_SUFFIXES = {
+    'gzip': '.gz',
+    'brotli': '.br',
+}
+
+
+class BrotliFile(object):
+    """Minimal binary file object that compresses what is written to it.
+
+    ``brotli`` only offers a streaming ``Compressor``, rather than a file
+    object like ``gzip.GzipFile``, so this wraps one around a regular file so
+    both can be written to the same way.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._compressor = brotli.Compressor()
+
+    def write(self, data):
+        self._file.write(self._compressor.process(data))
+
+    def close(self):
+        self._file.write(self._compressor.finish())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_output_file(path, compression=None):
+    """Open ``path`` for writing bytes, compressing them if requested.
+
+    Returns the file object, and the path that was actually opened, as the
+    compression suffix is appended to the given path when compressing.
+    """
+    if compression is None:
+        return open(path, 'wb'), path
+    path += COMPRESSION_SUFFIXES[compression]
+    if compression == 'gzip':
+        return gzip.open(path, 'wb'), path
+    return BrotliFile(path), path
+
+
+class LogFragmentCache(object):
+    """Rendered logs kept on disk, so later runs don't have to render them.
+
+    Each fragment is stored in its own file, named after its key. Reading a
+    fragment touches its file, so the modification times tell which were used
+    the longest ago, and those are removed first by ``evict`` once the
+    fragments take up more than ``max_size`` bytes.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    def _path(self, key):
+        return os.path.join(self.directory, '{0}.html'.format(key))
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                fragment = f.read().decode('utf-8')
+            os.utime(path, None)
+        except (IOError, OSError):
+            return None
+        return fragment
+
+    def set(self, key, fragment):
+        path = self._path(key)
+        # written under another name first, so a fragment that's only partly
+        # written can never be read
+        temp_path = '{0}.{1}.tmp'.format(path, os.getpid())
+        with open(temp_path, 'wb') as f:
+            f.write(fragment.encode('utf-8'))
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            os.rename(temp_path, path)
+
+    def evict(self):
+        """Remove the least recently used fragments, until it fits again.
+
+        Other runs may share the cache, and remove (or add) fragments at the
+        same time, so the ones that are already gone are skipped, and the
+        ones still being written by them are left alone.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size -= entry_size
+
+
+class StringTable(object):
+    """Table of distinct strings, which are referred to by their index.
+
+    Names, base IDs and the like are repeated for many of the nodes in the
+    results tree, so storing each of them only once keeps the payload of the
+    report small.
+    """
+
+    def __init__(self):
+        self.strings = []
+        self._indexes = {}
+
+    def index(self, value):
+        """Get the index of the value, adding it to the table if needed."""
+        if value is None:
+            return -1
+        try:
+            return self._indexes[value]
+        except KeyError:
+            self._indexes[value] = len(self.strings)
+            self.strings.append(value)
+            return self._indexes[value]
+
+
+class NoStringTable(object):
+    """Stand-in for a ``StringTable`` that leaves the strings in place."""
+
+    def index(self, value):
+        return value
+
+
+NO_STRING_TABLE = NoStringTable()
+
+
 class SerializableParamFixInfo(object):
     """Used to store the current state of the FixtureDef for later comparison.
 
@@ -107,30 +552,30 @@ class SerializableParamFixInfo(object):
     This class also ensures that whenever creating an instance of it, if an
     instance that matches it was already created, the one that was already
     created is the one returned. This prevents dealing with more complicated
-    lookups in the tree and allows for simpler comparisons.
+    lookups in the tree and allows for simpler comparisons. The lookup is done
+    while holding ``_lock``, so tests reporting from several threads at once
+    can't end up with two instances for the same parameter.
     """
 
     _instances = []
+    _lock = threading.Lock()
     _alread_initialized = False
 
     def __new__(cls, name, description, param_index, baseid):
         temp = super(SerializableParamFixInfo, cls).__new__(cls)
         temp.__init__(name, description, param_index, baseid)
-        if temp not in cls._instances:
-            cls._instances.append(temp)
-            return temp
-        return cls._instances[cls._instances.index(temp)]
+        with cls._lock:
+            if temp not in cls._instances:
+                cls._instances.append(temp)
+                return temp
+            return cls._instances[cls._instances.index(temp)]
 
     def __init__(self, name, description, param_index, baseid):
         if self._alread_initialized:
             return
 
         self.name = name
-
-        methodname = 'save_' + type(description).__name__
-        if not hasattr(_Serializer, methodname):
-            description = str(description)
-        self.description = description
+        self.description = to_serializable_description(description)
 
         self.param_index = param_index
         self.baseid = baseid
@@ -151,23 +596,38 @@ class SerializableParamFixInfo(object):
             same_baseid,
         ))
 
-    def to_dict(self):
+    def to_dict(self, strings=None):
+        if strings is None:
+            strings = NO_STRING_TABLE
         return {
-            "name": self.name,
-            "description": self.description,
+            "name": strings.index(self.name),
+            "description": to_json_value(self.description),
             "param_index": self.param_index,
-            "baseid": self.baseid,
+            "baseid": strings.index(self.baseid),
         }
 
     def serialize(self):
         return {
             "name": self.name,
-            "description": repr(self.description),
+            "description": format_param_description(self.description),
             "param_index": self.param_index,
             "baseid": self.baseid,
         }
 
 
+def to_serializable_description(description):
+    """Convert the description of a parameter to one execnet can serialize."""
+    methodname = 'save_' + type(description).__name__
+    if not hasattr(_Serializer, methodname):
+        description = str(description)
+    return description
+
+
+def format_param_description(description):
+    """Format the description of a parameter as it's shown in the report."""
+    return repr(to_serializable_description(description))
+
+
 class SerializableNode(object):
     """Branching node in test suite tree structure.
 
@@ -203,21 +663,26 @@ class SerializableNode(object):
     before the serialization event, and some information would be lost (e.g.
     test logs). When a node is serialized, this attribute isn't included, so
     when the nodes are reconstructed, it will automatically be ``False``.
+
+    Tests may be reported from several threads at once (e.g. with thread based
+    runners like ``pytest-parallel``), so looking up the nodes, and changing
+    the ones that are shared between tests, is done while holding ``_lock``.
     """
 
     _instances = []
+    _lock = threading.RLock()
     _alread_initialized = False
 
     def __new__(cls, **kwargs):
         temp = super(SerializableNode, cls).__new__(cls)
         temp.__init__(**kwargs)
-        if temp not in cls._instances:
-            cls._instances.append(temp)
-            return temp
-        node = cls._instances[cls._instances.index(temp)]
-        if node.extra != temp.extra:
-            node.extra.extend(temp.extra)
-        return node
+        with cls._lock:
+            if temp not in cls._instances:
+                cls._instances.append(temp)
+                return temp
+            node = cls._instances[cls._instances.index(temp)]
+            node.merge_extra(temp.extra)
+            return node
 
     def __init__(self, **kwargs):
         if self._alread_initialized:
@@ -245,6 +710,16 @@ class SerializableNode(object):
                 self.params = [SerializableParamFixInfo(**p) for p in params]
             else:
                 setattr(self, attr, kwargs.get(attr, value))
+        extra = self.extra
+        self.extra = []
+        self._extra_keys = set()
+        self._deduplicated_count = 0
+        self._sent_extra_count = 0
+        self.merge_extra(extra)
+        self.phase_durations = dict.fromkeys(PHASES, 0.0)
+        self.duration_histogram = [0] * (len(DURATION_BUCKETS) + 1)
+        self.baseline = None
+        self.regression = False
         if not self.is_test:
             self.summary = kwargs.get(
                 "summary",
@@ -275,17 +750,147 @@ class SerializableNode(object):
         )
         return all(getattr(self, a) == getattr(other, a) for a in eq_attrs)
 
+    def merge_extra(self, extra):
+        """Add the extra content that this node doesn't already have.
+
+        The same node is looked up for every test that passes through it, and
+        each time, it may be given the extra content it was already given
+        before, so only the content that wasn't seen before is added.
+        """
+        with self._lock:
+            self._deduplicate_extra()
+            for e in extra:
+                key = get_extra_key(e)
+                if key not in self._extra_keys:
+                    self._extra_keys.add(key)
+                    self.extra.append(e)
+            self._deduplicated_count = len(self.extra)
+
+    def take_unsent_extra(self, relevant=True):
+        """Get the extra content that hasn't been serialized yet.
+
+        Only what's new has to be sent up in the node chain of the current
+        test, as the content that was sent before is already part of the node
+        on the receiving end. Deferred content is resolved if it's
+        ``relevant``, and otherwise kept back until the node is sent up for a
+        test it's relevant to, as the node may be shared with other tests.
+        """
+        with self._lock:
+            self._deduplicate_extra()
+            unsent = self.extra[self._sent_extra_count:]
+            pending = []
+            if not relevant:
+                pending = [e for e in unsent if is_deferred_extra(e)]
+                unsent = [e for e in unsent if not is_deferred_extra(e)]
+                # the pending content is moved after what's sent, so it's
+                # still unsent the next time
+                self.extra[self._sent_extra_count:] = unsent + pending
+            self._sent_extra_count = len(self.extra) - len(pending)
+        return resolve_deferred_extra(unsent, relevant)
+
+    def resolve_files(self, store_file):
+        """Replace the files in the extra content with what's in them.
+
+        Deferred files are read, and the files attached with ``extras.file``
+        are given to ``store_file``, which returns the extra content to show
+        in their place. The keys of the original content are kept, so if the
+        same file is sent up again (e.g. by another worker), it's still known
+        as a duplicate.
+        """
+        with self._lock:
+            extra = []
+            for e in self.extra:
+                if is_deferred_file(e):
+                    e = read_deferred_file(e)
+                elif is_file_extra(e):
+                    e = store_file(e)
+                if e is not None:
+                    extra.append(e)
+            self.extra = extra
+            self._deduplicated_count = len(self.extra)
+            self._sent_extra_count = len(self.extra)
+
+    def _deduplicate_extra(self):
+        """Drop the content appended directly to ``extra`` that it already has.
+
+        Plugins can append to the ``extra`` of the nodes directly (e.g. with
+        the ``pytest_html_add_node_chain_extra`` hook), often with the same
+        content for every test, so whatever was appended since the last time
+        is checked against what the node already has.
+        """
+        if len(self.extra) < self._deduplicated_count:
+            # the list was cleared, or replaced with a shorter one
+            self._extra_keys = set()
+            self._deduplicated_count = 0
+            self._sent_extra_count = 0
+        new_extra = []
+        for e in self.extra[self._deduplicated_count:]:
+            key = get_extra_key(e)
+            if key not in self._extra_keys:
+                self._extra_keys.add(key)
+                new_extra.append(e)
+        self.extra[self._deduplicated_count:] = new_extra
+        self._deduplicated_count = len(self.extra)
+
+    def count_test_duration(self, duration):
+        """Count the duration of a test in this node in its histogram."""
+        bucket = bisect.bisect_left(DURATION_BUCKETS, duration)
+        self.duration_histogram[bucket] += 1
+
+    @property
+    def path(self):
+        """The names (and parameters) of this node and its parents."""
+        names = []
+        node = self
+        while node is not None:
+            name = node.name
+            if node.params:
+                name += "[{0}]".format(node.param_description)
+            names.append(name)
+            node = node.parent
+        return "::".join(reversed(names))
+
+    def add_phase_durations(self, phase_durations):
+        """Add how long each phase of a test took to this node and its parents.
+
+        The durations only become known once the test is torn down, which is
+        after the node chain of the test was already added to the tree.
+        """
+        node = self
+        while node is not None:
+            for phase in PHASES:
+                node.phase_durations[phase] += phase_durations.get(phase, 0.0)
+            node = node.parent
+
     @property
     def param_description(self):
         return "-".join(str(p.description) for p in self.params)
 
-    def to_dict(self):
-        """Convert the structure to one that is JSON serializable."""
+    def to_dict(self, strings=None):
+        """Convert the structure to one that is JSON serializable.
+
+        If a ``StringTable`` is provided, the names, parameter descriptions and
+        outcomes of the nodes, and the names and base IDs of their parameters,
+        are added to it, and referred to by their index in it instead.
+        """
+        if strings is None:
+            strings = NO_STRING_TABLE
         json_repr = {
-            "name": escape(self.name),
+            "name": strings.index(escape(self.name)),
             "duration": "{0:.2f}".format(self.duration),
-            "params": [p.to_dict() for p in self.params],
-            "param_description": escape(self.param_description),
+            "phase_durations": dict(
+                (p, "{0:.2f}".format(d))
+                for p, d in self.phase_durations.items()
+            ),
+            "params": [p.to_dict(strings) for p in self.params],
+            "baseline": (
+                "{0:.2f}".format(self.baseline)
+                if self.baseline is not None else None
+            ),
+            "regression": self.regression,
+            "param_description": strings.index(
+                escape(self.param_description),
+            ),
             "extra": self.extra,
             "log": self.log,
         }
@@ -299,16 +904,20 @@ class SerializableNode(object):
             else:
                 json_repr["location"] = "Unknown"
             json_repr["location"] = self.location
-            json_repr["outcome"] = self.outcome
+            json_repr["outcome"] = strings.index(self.outcome)
         else:
             json_repr["summary"] = self.summary
-            json_repr["children"] = [c.to_dict() for c in self.children]
-            json_repr["test_results"] = [c.to_dict() for c in self.test_results]
+            json_repr["children"] = [
+                c.to_dict(strings) for c in self.children
+            ]
+            json_repr["test_results"] = [
+                c.to_dict(strings) for c in self.test_results
+            ]
             if self.is_xdist_slave:
                 json_repr["is_xdist_slave"] = True
         return json_repr
 
-    def to_serializable_node_chain_link(self):
+    def to_serializable_node_chain_link(self, relevant=True):
         """Convert to something that can be serialized in a list of other nodes.
 
         In the event that ``pytest-xdist`` is used, the information about this
@@ -327,7 +936,8 @@ class SerializableNode(object):
         as ``extra``, so it can later be embedded in the HTML report. For
         example, taking a screenshot of a browser when a test fails, but
         attaching it to the module level node, so it shows up in the HTML report
-        at the top of that section.
+        at the top of that section. Whether deferred extra content is resolved
+        depends on whether it's ``relevant`` to the outcome of the test.
         """
         serialized = {
             "name": self.name,
@@ -337,7 +947,7 @@ class SerializableNode(object):
             "log": self.log,
             "is_test": self.is_test,
             "is_xdist_slave": self.is_xdist_slave,
-            "extra": self.extra,
+            "extra": self.take_unsent_extra(relevant),
         }
         if self.is_test:
             serialized["outcome"] = self.outcome
@@ -345,51 +955,321 @@ class SerializableNode(object):
         return serialized
 
 
+class RenderingThread(threading.Thread):
+    """Thread that renders and aggregates the test reports in the background.
+
+    Rendering the log of a report, and adding it to the results tree, would
+    otherwise happen between tests (or, with ``pytest-xdist``, while results
+    from the workers are waiting to be processed). The work is queued up
+    instead, and done one call at a time, in the order it was added. Any error
+    raised while doing it is raised again from ``finish``, once all of it was
+    done.
+    """
+
+    _done = object()
+
+    def __init__(self):
+        super(RenderingThread, self).__init__(name='pytest-html-rendering')
+        self.daemon = True
+        self._queue = Queue()
+        self._error = None
+
+    def add(self, func, *args):
+        self._queue.put((func, args))
+
+    def run(self):
+        while True:
+            work = self._queue.get()
+            if work is self._done:
+                return
+            if self._error is not None:
+                # the tree can't be trusted anymore, so skip what's left
+                continue
+            func, args = work
+            try:
+                func(*args)
+            except Exception as e:
+                self._error = e
+
+    def finish(self):
+        """Wait for all the queued reports to be handled."""
+        self._queue.put(self._done)
+        self.join()
+        if self._error is not None:
+            raise self._error
+
+
 class HTMLReport(object):
+    """Collects the test reports, and generates the HTML report from them.
 
-    results_tree = {
-        "summary": {
-            "passed": 0,
-            "skipped": 0,
-            "failed": 0,
-            "error": 0,
-            "xfailed": 0,
-            "xpassed": 0,
-        },
-        "results": [],
-    }
+    Reports are counted, and added to the ``results_tree`` (or handed to the
+    ``RenderingThread``), while holding ``_lock``, so the ones coming in from
+    different threads at the same time are handled one after the other.
+    """
+
+    _lock = threading.Lock()
+
+    slowest_limit = 10
 
     def __init__(self, logfile, config):
         logfile = os.path.expanduser(os.path.expandvars(logfile))
         self.logfile = os.path.abspath(logfile)
         self.test_logs = []
         self.results = []
+        self.results_tree = {
+            "summary": dict.fromkeys(OUTCOMES, 0),
+            "phase_durations": dict.fromkeys(PHASES, 0.0),
+            "results": [],
+        }
         self.errors = self.failed = 0
         self.passed = self.skipped = 0
         self.xfailed = self.xpassed = 0
         has_rerun = config.pluginmanager.hasplugin('rerunfailures')
         self.rerun = 0 if has_rerun else None
         self.self_contained = config.getoption('self_contained_html')
+        self.compression = config.getoption('html_compress')
+        self.compress_payload = config.getoption('html_compress_payload')
+        self.payload_format = config.getoption('html_payload_format')
+        self.json_backend = get_json_backend(
+            config.getoption('html_json_backend'),
+        )
+        self.lazy_payload = all((
+            config.getoption('html_lazy_payload'),
+            not self.self_contained,
+            self.payload_format != 'columnar',
+        ))
+        self.lazy_payloads = OrderedDict()
+        self.logs = OrderedDict()
+        self.log_limit = config.getoption('html_log_limit')
+        self.log_section_limit = config.getoption('html_log_section_limit')
+        self.rendering_thread = None
+        self._test_nodes = {}
+        self._stored_files = {}
+        self.results_db = config.getoption('html_results_db')
+        self.thumbnail_size = config.getoption('html_thumbnail_size')
+        self.thumbnail_processes = config.getoption(
+            'html_thumbnail_processes',
+        )
+        if self.thumbnail_processes is None:
+            self.thumbnail_processes = multiprocessing.cpu_count()
+        self.fixture_durations = OrderedDict()
+        self.worker_timings = {}
+        self.slowest_tests = []
+        self._slow_tests_count = 0
+        self.log_cache = None
+        if config.getoption('html_log_cache'):
+            self.log_cache = LogFragmentCache(
+                str(config.cache.makedir('pytest_html_logs')),
+                config.getoption('html_log_cache_size') * 1024 * 1024,
+            )
+        # the rendered logs depend on these, besides the output of the tests
+        self._log_cache_salt = repr((
+            __version__,
+            ANSI,
+            self.log_limit,
+            self.log_section_limit,
+            self.self_contained,
+            COMPRESSION_SUFFIXES.get(self.compression),
+        ))
+        self._spooled_logs = 0
+        self.history = config.getoption('html_history')
+        self.history_runs = config.getoption('html_history_runs')
         self.config = config
 
-    def results_tree_to_dict(self, session):
-        rslts_tree = self.__class__.results_tree
+    def results_tree_to_dict(self, session, interned=False):
+        """Convert the results tree to a nested, JSON serializable structure.
+
+        If ``interned``, the strings that are repeated throughout the tree are
+        stored once in a shared ``strings`` list, and the nodes refer to them
+        by their index in it (see ``SerializableNode.to_dict``).
+        """
+        rslts_tree = self.results_tree
+        strings = StringTable() if interned else None
+        tree = {
+            "name": session.name,
+            "summary": rslts_tree["summary"],
+            "phase_durations": rslts_tree["phase_durations"],
+            "results": [n.to_dict(strings) for n in rslts_tree["results"]],
+            "logs": self.logs,
+            "suite_info": self._suite_info_to_dict(),
+        }
+        if interned:
+            tree["format"] = "interned"
+            tree["strings"] = strings.strings
+        return tree
+
+    def results_tree_to_columns(self, session):
+        """Convert the results tree to parallel columns, one row per node.
+
+        Rather than nesting the nodes and tests, each one becomes a row in a
+        set of columns, with the ``parent`` column referring to the row of the
+        node it belongs to (or ``-1`` for the top level nodes). Rows are in
+        depth first order, with the tests of a node preceding its child nodes,
+        so the order of both within their parent is preserved.
+
+        The text of each row is stored once in the ``strings`` table (and
+        logs, which are only stored once as well, and extras in their own
+        tables), with the columns only holding indexes
+        into them (or ``-1`` if a row has none). The columns are packed as
+        little-endian binary and base64 encoded, so the report can load them
+        as typed arrays rather than having to parse them, with the type of
+        each (``"d"`` for doubles, ``"i"`` for integers) in ``column_types``.
+        ``summary`` holds the count of each of ``outcomes`` for every row, one
+        after the other, and ``phase_durations`` how long each of ``phases``
+        took the same way.
+        """
+        rslts_tree = self.results_tree
+        strings = StringTable()
+        logs = StringTable()
+        extra_table = []
+        columns = OrderedDict((c, []) for c in (
+            "parent",
+            "name",
+            "param_description",
+            "nodeid",
+            "location",
+            "outcome",
+            "duration",
+            "phase_durations",
+            "baseline_duration",
+            "regression",
+            "log",
+            "extra",
+            "summary",
+            "is_xdist_slave",
+        ))
+        # the columns holding seconds, all the others hold integers
+        float_columns = ("duration", "phase_durations", "baseline_duration")
+        column_types = OrderedDict(
+            (c, "d" if c in float_columns else "i") for c in columns
+        )
+        nodeids = []
+        paths = []
+
+        intern = strings.index
+
+        def add_row(node, parent):
+            row = len(columns["parent"])
+            columns["parent"].append(parent)
+            columns["name"].append(intern(escape(node.name)))
+            columns["param_description"].append(
+                intern(escape(node.param_description)),
+            )
+            columns["duration"].append(node.duration)
+            columns["phase_durations"].extend(
+                node.phase_durations[p] for p in PHASES
+            )
+            columns["baseline_duration"].append(
+                node.baseline if node.baseline is not None else float("nan"),
+            )
+            columns["regression"].append(int(node.regression))
+            columns["is_xdist_slave"].append(int(node.is_xdist_slave))
+            if node.extra:
+                columns["extra"].append(len(extra_table))
+                extra_table.append(node.extra)
+            else:
+                columns["extra"].append(-1)
+            if node.is_test:
+                nodeid = escape(node.nodeid or "Unknown")
+                columns["nodeid"].append(intern(nodeid))
+                location = "Unknown"
+                if node.location is not None:
+                    location = ",".join(str(p) for p in node.location)
+                columns["location"].append(intern(location))
+                columns["outcome"].append(intern(node.outcome))
+                columns["log"].append(logs.index(node.log))
+                columns["summary"].extend(0 for o in OUTCOMES)
+            else:
+                for c in ("nodeid", "location", "outcome", "log"):
+                    columns[c].append(-1)
+                columns["summary"].extend(node.summary[o] for o in OUTCOMES)
+            return row
+
+        def add_node(node, parent, path):
+            row = add_row(node, parent)
+            for i, test in enumerate(node.test_results):
+                add_row(test, row)
+                nodeids.append(escape(test.nodeid or "Unknown"))
+                paths.append(path + [i])
+            for i, child in enumerate(node.children):
+                add_node(child, row, path + [i])
+
+        for i, node in enumerate(rslts_tree["results"]):
+            add_node(node, -1, [i])
+
         return {
             "name": session.name,
+            "format": "columnar",
             "summary": rslts_tree["summary"],
-            "results": [n.to_dict() for n in rslts_tree["results"]],
-            "suite_info": {
-                "generated": rslts_tree["suite_info"]["generated"].isoformat(),
-                "run_time": rslts_tree["suite_info"]["run_time"],
-                "numtests": rslts_tree["suite_info"]["numtests"],
-                "environment": rslts_tree["suite_info"]["environment"],
-            },
+            "phase_durations": rslts_tree["phase_durations"],
+            "suite_info": self._suite_info_to_dict(),
+            "outcomes": list(OUTCOMES),
+            "phases": list(PHASES),
+            "strings": strings.strings,
+            "logs": [self.logs[key] for key in logs.strings],
+            "extras": extra_table,
+            "column_types": column_types,
+            "columns": OrderedDict(
+                (c, pack_column(column_types[c], values))
+                for c, values in columns.items()
+            ),
+            "search_index": {"nodeids": nodeids, "paths": paths},
+        }
+
+    def _suite_info_to_dict(self):
+        suite_info = self.results_tree["suite_info"]
+        return {
+            "generated": suite_info["generated"].isoformat(),
+            "run_time": suite_info["run_time"],
+            "numtests": suite_info["numtests"],
+            "environment": suite_info["environment"],
         }
 
+    def _store_log(self, report):
+        """Render the log of the report, unless an identical one already was.
+
+        Tests often produce logs identical to those of other tests (e.g. the
+        same failure for many parameters), so the logs are stored under a hash
+        of their raw content, and only rendered the first time it's seen.
+        Returns the key the log is stored under.
+        """
+        key = get_log_key(report)
+        if key not in self.logs:
+            self.logs[key] = self._get_cached_log(key, report)
+        return key
+
+    def _get_cached_log(self, key, report):
+        """Get the rendered log from the cache, or render it and cache it.
+
+        Logs that had parts of them written to the assets directory aren't
+        cached, as those files may not be there for the reports of later runs.
+        """
+        if self.log_cache is None:
+            return self._get_log_from_report(report)
+        cache_key = hashlib.sha1(
+            (key + self._log_cache_salt).encode('utf-8'),
+        ).hexdigest()
+        log = self.log_cache.get(cache_key)
+        if log is None:
+            spooled_logs = self._spooled_logs
+            log = self._get_log_from_report(report)
+            if self._spooled_logs == spooled_logs:
+                self.log_cache.set(cache_key, log)
+        return log
+
     def _get_log_from_report(self, report):
         log = html.div(class_='log')
-        if report.longrepr:
-            for line in report.longreprtext.splitlines():
+        remaining = self.log_limit
+
+        def limit_for(remaining):
+            limits = [
+                limit for limit in (self.log_section_limit, remaining)
+                if limit is not None
+            ]
+            return min(limits) if limits else None
+
+        def append_longrepr(text):
+            for line in text.splitlines():
                 separator = line.startswith('_ ' * 10)
                 if separator:
                     log.append(line[:80])
@@ -402,15 +1282,42 @@ class HTMLReport(object):
                         log.append(raw(escape(line)))
                 log.append(html.br())
 
-        for section in report.sections:
-            header, content = map(escape, section)
-            log.append(' {0} '.format(header).center(80, '-'))
-            log.append(html.br())
+        def append_section_content(content):
+            content = escape(content)
             if ANSI:
                 converter = Ansi2HTMLConverter(inline=False, escaped=False)
                 content = converter.convert(content, full=False)
             log.append(raw(content))
 
+        if report.longrepr:
+            parts = self._limit_log_content(
+                report.longreprtext,
+                limit_for(remaining),
+            )
+            for part in parts:
+                if isinstance(part, basestring):
+                    append_longrepr(part)
+                else:
+                    log.extend([part, html.br()])
+            if remaining is not None:
+                remaining -= sum(
+                    len(p) for p in parts if isinstance(p, basestring)
+                )
+
+        for header, content in report.sections:
+            log.append(' {0} '.format(escape(header)).center(80, '-'))
+            log.append(html.br())
+            parts = self._limit_log_content(content, limit_for(remaining))
+            for part in parts:
+                if isinstance(part, basestring):
+                    append_section_content(part)
+                else:
+                    log.extend([html.br(), part, html.br()])
+            if remaining is not None:
+                remaining -= sum(
+                    len(p) for p in parts if isinstance(p, basestring)
+                )
+
         if len(log) == 0:
             log = html.div(class_='empty log')
             log.append('No log output captured.')
@@ -423,6 +1330,52 @@ class HTMLReport(object):
             unicode_log = unicode_log.decode('utf-8')
         return unicode_log
 
+    def _limit_log_content(self, content, limit):
+        """Shorten the content of a log to its head and tail, if it's too long.
+
+        Returns the parts of the log to show, which is either just the content,
+        or its head and tail, with a notice about what was omitted between
+        them. Unless the report is self-contained, the full content is written
+        to a file in the assets directory, and linked to from the notice.
+        """
+        if limit is None or len(content) <= limit:
+            return [content]
+        limit = max(limit, 0)
+        head = content[:limit // 2]
+        tail = content[len(content) - (limit - limit // 2):]
+        omitted = u'... {0} characters omitted'.format(len(content) - limit)
+        if self.self_contained:
+            notice = html.span(omitted + u' ...', class_='log-truncated')
+        else:
+            notice = html.span(
+                omitted + u', see the ',
+                html.a(
+                    'full output',
+                    href=self._spool_log_content(content),
+                    target='_blank',
+                ),
+                u' ...',
+                class_='log-truncated',
+            )
+        return [head, notice, tail]
+
+    def _spool_log_content(self, content):
+        """Write the content of a log to the assets, and return its path."""
+        key = hashlib.sha1(
+            content.encode('utf-8', 'backslashreplace'),
+        ).hexdigest()
+        logs_dir = os.path.join(
+            os.path.dirname(self.logfile),
+            'assets',
+            'logs',
+        )
+        if not os.path.exists(logs_dir):
+            os.makedirs(logs_dir)
+        path = os.path.join(logs_dir, '{0}.txt'.format(key))
+        self._write_file(path, content, compress=False)
+        self._spooled_logs += 1
+        return 'assets/logs/{0}.txt'.format(key)
+
     def _appendrow(self, outcome, report):
         outcome = outcome.lower()
         node_chain = None
@@ -442,29 +1395,180 @@ class HTMLReport(object):
                 ),
             )
 
+        if self.rendering_thread is not None:
+            self.rendering_thread.add(
+                self._aggregate, outcome, report, node_chain,
+            )
+        else:
+            self._aggregate(outcome, report, node_chain)
+
+    def _aggregate(self, outcome, report, node_chain):
+        """Render the log of the report, and add its node chain to the tree."""
         duration = node_chain[-1]["duration"]
 
-        results_tree = self.__class__.results_tree
+        results_tree = self.results_tree
         results_tree["summary"][outcome] += 1
 
         prev_node = None
         for n in node_chain:
             if n.get("is_test", False):
-                n["log"] = self._get_log_from_report(report)
+                n["log"] = self._store_log(report)
             node = SerializableNode(parent=prev_node, **n)
             if node.is_test:
                 if prev_node is None:
                     raise Exception("'prev_node' is None when it shouldn't be.")
                 prev_node.test_results.append(node)
+                self._test_nodes[node.nodeid] = node
+                self._count_slow_test(node, duration)
                 continue
             node.summary[outcome] += 1
             node.duration += duration
+            node.count_test_duration(duration)
             if prev_node is None and node not in results_tree["results"]:
                 results_tree["results"].append(node)
             if prev_node is not None and node not in prev_node.children:
                 prev_node.children.append(node)
             prev_node = node
 
+    def _compare_to_history(self):
+        """Compare the tests to their earlier runs, and add them to history.
+
+        The history is kept in the pytest cache, as the durations and outcomes
+        of each test in the last ``history_runs`` runs, numbered so the tests
+        that haven't run in any of those can be dropped. Each test gets the
+        mean of its earlier durations as its ``baseline``, and is flagged as a
+        ``regression`` if it got significantly slower. The groups get the sum
+        of the baselines of their tests, and are flagged if any of them are.
+        """
+        cache = self.config.cache
+        history = cache.get(HISTORY_KEY, {"run": 0, "tests": {}})
+        run = history["run"] + 1
+        tests = history["tests"]
+        for nodeid, node in self._test_nodes.items():
+            entries = tests.setdefault(nodeid, [])
+            durations = [duration for _, duration, _ in entries]
+            if durations:
+                node.baseline = sum(durations) / len(durations)
+            node.regression = is_duration_regression(node.duration, durations)
+            entries.append([run, round(node.duration, 4), node.outcome])
+            del entries[:-self.history_runs]
+        for nodeid in list(tests):
+            if tests[nodeid][-1][0] <= run - self.history_runs:
+                del tests[nodeid]
+        cache.set(HISTORY_KEY, {"run": run, "tests": tests})
+
+        def add_up(node):
+            baselines = [t.baseline for t in node.test_results]
+            regressions = [t.regression for t in node.test_results]
+            for child in node.children:
+                add_up(child)
+                baselines.append(child.baseline)
+                regressions.append(child.regression)
+            baselines = [b for b in baselines if b is not None]
+            if baselines:
+                node.baseline = sum(baselines)
+            node.regression = any(regressions)
+
+        for node in self.results_tree["results"]:
+            add_up(node)
+
+    def _count_slow_test(self, node, duration):
+        """Keep the test if it's one of the slowest so far.
+
+        The slowest tests are kept in a heap of a bounded size, with the
+        fastest of them on top, so it can be pushed out by a slower one
+        without having to sort all the tests.
+        """
+        self._slow_tests_count += 1
+        entry = (duration, self._slow_tests_count, node)
+        if len(self.slowest_tests) < self.slowest_limit:
+            heapq.heappush(self.slowest_tests, entry)
+        elif duration > self.slowest_tests[0][0]:
+            heapq.heapreplace(self.slowest_tests, entry)
+
+    def _appendtiming(self, report):
+        timing = pop_user_property(report, "pytest_html_report_test_timing")
+        if timing is None:
+            return
+
+        self.worker_timings.setdefault(timing["worker"], []).append(
+            (timing["start"], timing["stop"]),
+        )
+        if self.rendering_thread is not None:
+            self.rendering_thread.add(
+                self._add_phase_durations, report.nodeid, timing["phases"],
+            )
+        else:
+            self._add_phase_durations(report.nodeid, timing["phases"])
+
+    def _add_phase_durations(self, nodeid, phase_durations):
+        """Add how long each phase of a test took to its node in the tree.
+
+        If the test was run more than once (e.g. when rerun), the durations
+        go to the node it was last reported on.
+        """
+        node = self._test_nodes.get(normalize_nodeid(nodeid))
+        if node is None:
+            return
+        node.add_phase_durations(phase_durations)
+        totals = self.results_tree["phase_durations"]
+        for phase in PHASES:
+            totals[phase] += phase_durations.get(phase, 0.0)
+
+    def _appendnodeextras(self, report):
+        node_chain = pop_user_property(
+            report,
+            "pytest_html_report_node_extras",
+        )
+        if node_chain is None:
+            return
+
+        if self.rendering_thread is not None:
+            self.rendering_thread.add(self._merge_node_extras, node_chain)
+        else:
+            self._merge_node_extras(node_chain)
+
+    def _merge_node_extras(self, node_chain):
+        """Add the extra content collected for the nodes once they were done.
+
+        Looking the nodes up again is enough, as the extra content a node is
+        created with is merged into the one that already exists.
+        """
+        prev_node = None
+        for n in node_chain:
+            prev_node = SerializableNode(parent=prev_node, **n)
+
+    def _appendfixtures(self, report):
+        """Add up how long the fixtures set up and torn down for a test took.
+
+        Fixtures are identified the same way as by ``SerializableParamFixInfo``
+        (i.e. by their name, the index of their parameter, and where they were
+        defined), so each parameter of a fixture is counted separately.
+        """
+        fixture_durations = pop_user_property(
+            report,
+            "pytest_html_report_fixture_durations",
+        )
+        for timing in fixture_durations or []:
+            key = (timing["name"], timing["param_index"], timing["baseid"])
+            stats = self.fixture_durations.get(key)
+            if stats is None:
+                stats = self.fixture_durations[key] = {
+                    "name": timing["name"],
+                    "description": timing["description"],
+                    "param_index": timing["param_index"],
+                    "baseid": timing["baseid"],
+                    "scope": timing["scope"],
+                    "count": 0,
+                    "setup": 0.0,
+                    "teardown": 0.0,
+                }
+            if "setup" in timing:
+                stats["count"] += 1
+                stats["setup"] += timing["setup"]
+            if "teardown" in timing:
+                stats["teardown"] += timing["teardown"]
+
     def append_passed(self, report):
         if report.when == 'call':
             if hasattr(report, "wasxfail"):
@@ -500,7 +1604,136 @@ class HTMLReport(object):
         self.rerun += 1
         self._appendrow('Rerun', report)
 
+    def _iter_nodes(self):
+        nodes = list(self.results_tree["results"])
+        while nodes:
+            node = nodes.pop()
+            yield node
+            nodes.extend(node.children)
+            nodes.extend(node.test_results)
+
+    def _resolve_files(self):
+        for node in self._iter_nodes():
+            if node.extra:
+                node.resolve_files(self._store_file)
+
+    def _make_thumbnails(self):
+        """Give the images in the extra content thumbnails to show instead.
+
+        Only the images that are embedded, or are files next to the report,
+        can be made into thumbnails, so the others (e.g. those that are
+        linked to) are shown in full. Self-contained reports don't get any,
+        as they embed the full images anyway. Each distinct image is only
+        made into a thumbnail once, and, if there are enough of them, that's
+        done in a pool of processes.
+        """
+        report_dir = os.path.dirname(self.logfile)
+        images = []
+        sources = OrderedDict()
+        for node in self._iter_nodes():
+            for index, e in enumerate(node.extra):
+                if not isinstance(e, dict):
+                    continue
+                if e.get("format") != extras.FORMAT_IMAGE:
+                    continue
+                source = get_image_source(e.get("content"), report_dir)
+                if source is None:
+                    continue
+                key = hashlib.sha1(repr(source).encode('utf-8')).hexdigest()
+                sources[key] = source
+                images.append((node, index, key))
+        if not images:
+            return
+
+        sizes = [self.thumbnail_size] * len(sources)
+        if (ProcessPoolExecutor is not None and
+                self.thumbnail_processes > 1 and
+                len(sources) >= THUMBNAIL_POOL_MIN_IMAGES):
+            with ProcessPoolExecutor(self.thumbnail_processes) as pool:
+                thumbnails = list(pool.map(
+                    make_thumbnail, sources.values(), sizes,
+                ))
+        else:
+            thumbnails = list(map(make_thumbnail, sources.values(), sizes))
+
+        thumbnail_paths = {}
+        for key, thumbnail in zip(sources, thumbnails):
+            if thumbnail is not None:
+                thumbnail_paths[key] = self._store_thumbnail(key, thumbnail)
+        for node, index, key in images:
+            if key in thumbnail_paths:
+                node.extra[index] = dict(
+                    node.extra[index],
+                    thumbnail=thumbnail_paths[key],
+                )
+
+    def _store_thumbnail(self, key, thumbnail):
+        """Write the thumbnail to the assets, and get its path."""
+        thumbnails_dir = os.path.join(
+            os.path.dirname(self.logfile),
+            'assets',
+            'thumbnails',
+        )
+        if not os.path.exists(thumbnails_dir):
+            os.makedirs(thumbnails_dir)
+        with open(os.path.join(thumbnails_dir, key + '.png'), 'wb') as f:
+            f.write(thumbnail)
+        return 'assets/thumbnails/{0}.png'.format(key)
+
+    def _store_file(self, extra):
+        """Put the file attached with ``extras.file`` in the report.
+
+        The file is never read into memory as a whole. Unless the report is
+        self-contained, it's hard linked into the assets directory, or copied
+        there if it can't be, and linked to. Otherwise, it's embedded as a
+        data URI, base64 encoded a chunk at a time. Returns ``None`` if the
+        file doesn't exist.
+        """
+        path = extra["content"]["file_path"]
+        if path not in self._stored_files:
+            if not isfile(path):
+                return None
+            if self.self_contained:
+                self._stored_files[path] = "data:{0};base64,{1}".format(
+                    extra["mime_type"] or "application/octet-stream",
+                    b64encode_file(path),
+                )
+            else:
+                self._stored_files[path] = self._copy_to_assets(
+                    path,
+                    extra["extension"],
+                )
+        return dict(extra, content=self._stored_files[path])
+
+    def _copy_to_assets(self, path, extension):
+        """Link or copy the file into the assets, and return its new path."""
+        name = hashlib.sha1(path.encode('utf-8')).hexdigest()
+        if extension:
+            name += '.' + extension
+        files_dir = os.path.join(
+            os.path.dirname(self.logfile),
+            'assets',
+            'files',
+        )
+        if not os.path.exists(files_dir):
+            os.makedirs(files_dir)
+        asset_path = os.path.join(files_dir, name)
+        if os.path.lexists(asset_path):
+            os.remove(asset_path)
+        try:
+            os.link(path, asset_path)
+        except (AttributeError, OSError):
+            # hard links aren't supported, or the assets are on another
+            # file system, so it has to be copied
+            shutil.copyfile(path, asset_path)
+        return 'assets/files/{0}'.format(name)
+
     def _generate_report(self, session):
+        if self.history:
+            self._compare_to_history()
+        self._resolve_files()
+        if PILLOW and self.thumbnail_size and not self.self_contained:
+            self._make_thumbnails()
         suite_stop_time = time.time()
         suite_time_delta = suite_stop_time - self.suite_start_time
         numtests = self.passed + self.failed + self.xpassed + self.xfailed
@@ -510,7 +1743,7 @@ class HTMLReport(object):
         if metadata is not None:
             environment = metadata
 
-        self.__class__.results_tree["suite_info"] = {
+        self.results_tree["suite_info"] = {
             "generated": generated,
             "run_time": suite_time_delta,
             "numtests": numtests,
@@ -559,11 +1792,43 @@ class HTMLReport(object):
             with open(path, 'r') as f:
                 self.js_script += f.read()
 
-        results_tree_dict = self.results_tree_to_dict(session)
-        results_tree_json = json.dumps(results_tree_dict, indent=2)
+        if self.payload_format == 'columnar':
+            results_tree_dict = self.results_tree_to_columns(session)
+        else:
+            results_tree_dict = self.results_tree_to_dict(
+                session,
+                interned=self.payload_format == 'interned',
+            )
+            results_tree_dict["search_index"] = build_search_index(
+                results_tree_dict["results"],
+            )
+        results_db_tree = None
+        if self.results_db:
+            if self.payload_format == 'nested' and not self.lazy_payload:
+                results_db_tree = results_tree_dict
+            else:
+                results_db_tree = self.results_tree_to_dict(session)
+        if self.lazy_payload:
+            self.lazy_payloads = split_lazy_payloads(results_tree_dict)
         project_name = results_tree_dict["name"]
         self.js_script += "\n\nprojectName = '{}'".format(project_name)
-        self.js_script += "\n\nresultsTree = {}".format(results_tree_json)
+        # the page served by pytest-html-serve fetches the results instead
+        served_script = self.js_script + "\n\nresultsApi = 'api'"
+        if self.compress_payload:
+            results_tree_json = json_dumps(
+                results_tree_dict,
+                self.json_backend,
+            )
+            self.js_script += "\n\nresultsTreeCompressed = '{}'".format(
+                compress_payload(results_tree_json),
+            )
+        else:
+            results_tree_json = json_dumps(
+                results_tree_dict,
+                self.json_backend,
+                indent=True,
+            )
+            self.js_script += "\n\nresultsTree = {}".format(results_tree_json)
 
         js_ref = '{0}/{1}'.format('assets', 'script.js')
         html_script = html.script(src=js_ref, type='text/javascript')
@@ -579,6 +1844,23 @@ class HTMLReport(object):
 
         html_body = self._generate_body(results_tree_dict)
 
+        if results_db_tree is not None:
+            page = html.html(
+                html.head(
+                    html.meta(charset='utf-8'),
+                    html.title('Test Report'),
+                    html.style(raw(self.style_css)),
+                    html.script(raw(served_script)),
+                ),
+                html_body,
+            )
+            ResultsStore.write(
+                self.results_db,
+                results_db_tree,
+                u'<!DOCTYPE html>\n{0}'.format(page.unicode(indent=2)),
+                os.path.dirname(self.logfile),
+            )
+
         doc = html.html()
 
         doc.extend(
@@ -621,7 +1903,235 @@ class HTMLReport(object):
         )
         return environment
 
-    def _generate_summary_count(self, numtests, summary, run_time):
+    def _generate_fixture_durations(self, limit=10):
+        """List the fixtures that took the longest to set up and tear down."""
+        fixtures = sorted(
+            self.fixture_durations.values(),
+            key=lambda f: f["setup"] + f["teardown"],
+            reverse=True,
+        )[:limit]
+        rows = [html.tr(
+            html.th("Fixture"),
+            html.th("Parameter"),
+            html.th("Scope"),
+            html.th("Defined in"),
+            html.th("Setups"),
+            html.th("Setup (s)"),
+            html.th("Teardown (s)"),
+            html.th("Total (s)"),
+        )]
+        for f in fixtures:
+            rows.append(html.tr(
+                html.td(f["name"]),
+                html.td(f["description"] if f["description"] is not None
+                        else ""),
+                html.td(f["scope"]),
+                html.td(f["baseid"] or "-"),
+                html.td(f["count"]),
+                html.td("{0:.2f}".format(f["setup"])),
+                html.td("{0:.2f}".format(f["teardown"])),
+                html.td("{0:.2f}".format(f["setup"] + f["teardown"])),
+            ))
+
+        return html.div(
+            html.h2("Most expensive fixtures"),
+            html.div(
+                html.table(rows, id="fixture-durations"),
+                class_="fixture-durations-info",
+            ),
+            class_="fixture-durations-details",
+        )
+
+    def _generate_regressions(self):
+        """List the tests that got significantly slower than they used to."""
+        if not self.history:
+            return html.div(class_="regressions-details")
+        regressions = sorted(
+            (n for n in self._test_nodes.values() if n.regression),
+            key=lambda n: n.duration / max(n.baseline, 1e-6),
+            reverse=True,
+        )
+        rows = [html.tr(
+            html.th("Test"),
+            html.th("Baseline (s)"),
+            html.th("Duration (s)"),
+            html.th("Slowdown"),
+        )]
+        for node in regressions:
+            rows.append(html.tr(
+                html.td(node.nodeid),
+                html.td("{0:.2f}".format(node.baseline)),
+                html.td("{0:.2f}".format(node.duration)),
+                html.td("{0:.1f}x".format(
+                    node.duration / max(node.baseline, 1e-6),
+                )),
+            ))
+        return html.div(
+            html.h2("Slower than usual"),
+            html.p(
+                "{0} tests got significantly slower than they were in the "
+                "previous runs.".format(len(regressions)),
+            ),
+            html.div(
+                html.table(rows, id="regressions"),
+                class_="regressions-info",
+            ),
+            class_="regressions-details",
+        )
+
+    def _generate_analytics(self):
+        """Show the slowest tests and groups, and how long their tests took.
+
+        Everything shown here is counted while the reports come in (see
+        ``_aggregate``), so it only has to be laid out here. The slowest groups
+        are picked out of all of them with a heap, rather than sorting them.
+        """
+        def format_bound(bound):
+            if bound is None:
+                return "> {0:g}s".format(DURATION_BUCKETS[-1])
+            return "<= {0:g}s".format(bound)
+
+        test_rows = [html.tr(
+            html.th("Test"),
+            html.th("Outcome"),
+            html.th("Duration (s)"),
+        )]
+        for duration, _, node in sorted(self.slowest_tests, reverse=True):
+            test_rows.append(html.tr(
+                html.td(node.nodeid),
+                html.td(node.outcome),
+                html.td("{0:.2f}".format(duration)),
+            ))
+
+        nodes = []
+        pending = list(self.results_tree["results"])
+        while pending:
+            node = pending.pop()
+            pending.extend(node.children)
+            if not node.is_xdist_slave:
+                nodes.append(node)
+        slowest_nodes = heapq.nlargest(
+            self.slowest_limit,
+            nodes,
+            key=lambda n: n.duration,
+        )
+        node_rows = [html.tr(
+            html.th("Group"),
+            html.th("Tests"),
+            html.th("Duration (s)"),
+            html.th("Median"),
+            html.th("90th percentile"),
+            html.th("99th percentile"),
+            html.th("Distribution"),
+        )]
+        for node in slowest_nodes:
+            histogram = node.duration_histogram
+            highest = max(histogram) or 1
+            bars = [
+                html.div(
+                    class_="duration-histogram-bar",
+                    style="height: {0:.0f}%".format(count * 100.0 / highest),
+                    title="{0}: {1} tests".format(format_bound(bound), count),
+                )
+                for bound, count in zip(DURATION_BUCKETS + (None,), histogram)
+            ]
+            node_rows.append(html.tr(
+                html.td(node.path),
+                html.td(sum(histogram)),
+                html.td("{0:.2f}".format(node.duration)),
+                html.td(format_bound(histogram_percentile(histogram, 0.5))),
+                html.td(format_bound(histogram_percentile(histogram, 0.9))),
+                html.td(format_bound(histogram_percentile(histogram, 0.99))),
+                html.td(html.div(bars, class_="duration-histogram")),
+            ))
+
+        return html.div(
+            html.h2("Slowest tests"),
+            html.div(
+                html.table(test_rows, id="slowest-tests"),
+                class_="slowest-tests-info",
+            ),
+            html.h2("Slowest groups"),
+            html.div(
+                html.table(node_rows, id="slowest-groups"),
+                class_="slowest-groups-info",
+            ),
+            class_="analytics-details",
+        )
+
+    def _generate_worker_timeline(self):
+        """Show when each worker was running tests, and how long it sat idle.
+
+        The tests of a worker are drawn as bars on a timeline spanning from
+        when the first test started to when the last one finished, with the
+        bars of tests that ran (nearly) back to back merged into one, so the
+        gaps in between stand out.
+        """
+        timings = self.worker_timings
+        if not timings:
+            return html.div(class_="worker-timeline-details")
+        run_start = min(start for t in timings.values() for start, _ in t)
+        run_stop = max(stop for t in timings.values() for _, stop in t)
+        run_time = max(run_stop - run_start, 1e-6)
+
+        lanes = []
+        rows = [html.tr(
+            html.th("Worker"),
+            html.th("Tests"),
+            html.th("Busy (s)"),
+            html.th("Idle (s)"),
+            html.th("Idle at the end (s)"),
+            html.th("Utilization"),
+        )]
+        for worker in sorted(timings):
+            intervals = sorted(timings[worker])
+            busy = sum(stop - start for start, stop in intervals)
+            merged = [list(intervals[0])]
+            for start, stop in intervals[1:]:
+                if start - merged[-1][1] <= run_time / 1000:
+                    merged[-1][1] = max(merged[-1][1], stop)
+                else:
+                    merged.append([start, stop])
+            bars = [
+                html.div(
+                    class_="worker-timeline-bar",
+                    style="left: {0:.3f}%; width: {1:.3f}%".format(
+                        (start - run_start) * 100 / run_time,
+                        (stop - start) * 100 / run_time,
+                    ),
+                    title="{0:.2f}s to {1:.2f}s".format(
+                        start - run_start,
+                        stop - run_start,
+                    ),
+                )
+                for start, stop in merged
+            ]
+            lanes.append(html.div(
+                html.div(worker, class_="worker-timeline-label"),
+                html.div(bars, class_="worker-timeline-lane"),
+                class_="worker-timeline-row",
+            ))
+            rows.append(html.tr(
+                html.td(worker),
+                html.td(len(intervals)),
+                html.td("{0:.2f}".format(busy)),
+                html.td("{0:.2f}".format(run_time - busy)),
+                html.td("{0:.2f}".format(run_stop - intervals[-1][1])),
+                html.td("{0:.0f}%".format(busy * 100 / run_time)),
+            ))
+
+        return html.div(
+            html.h2("Worker timeline"),
+            html.div(lanes, class_="worker-timeline"),
+            html.div(
+                html.table(rows, id="worker-utilization"),
+                class_="worker-utilization-info",
+            ),
+            class_="worker-timeline-details",
+        )
+
+    def _generate_summary_count(self, numtests, summary, run_time,
+                                phase_durations):
         summary_count = html.div(
             html.h2("Summary"),
             html.div(
@@ -631,6 +2141,14 @@ class HTMLReport(object):
                         run_time,
                     ),
                 ),
+                html.p(
+                    "Setting up the tests took {0:.2f} seconds, running them "
+                    "{1:.2f} seconds, and tearing them down {2:.2f} "
+                    "seconds.".format(
+                        *(phase_durations[p] for p in PHASES)
+                    ),
+                    class_="phase-durations",
+                ),
                 html.p(
                     "Toggle the buttons to filter the results.",
                     class_="filter",
@@ -726,7 +2244,12 @@ class HTMLReport(object):
                 results_tree["suite_info"]["numtests"],
                 results_tree["summary"],
                 results_tree["suite_info"]["run_time"],
+                results_tree["phase_durations"],
             ),
+            self._generate_fixture_durations(),
+            self._generate_worker_timeline(),
+            self._generate_analytics(),
+            self._generate_regressions(),
             class_="project-test-results-summary",
         )]
         self.config.hook.pytest_html_results_summary(summary=summary_div)
@@ -737,6 +2260,15 @@ class HTMLReport(object):
                 html.button("collapse all", id="collapse-all-button"),
                 class_="show-hide-buttons",
             ),
+            html.div(
+                html.input(
+                    type="search",
+                    id="search-input",
+                    placeholder="Search tests by node ID",
+                ),
+                html.ul(id="search-results"),
+                class_="search",
+            ),
             html.div(class_="results-info"),
             class_="results-details",
         )]
@@ -755,42 +2287,318 @@ class HTMLReport(object):
         if not self.self_contained and not os.path.exists(assets_dir):
             os.makedirs(assets_dir)
 
-        with open(self.logfile, 'w', encoding='utf-8') as f:
-            f.write(report_content)
+        self.logfile = self._write_file(self.logfile, report_content)
         if not self.self_contained:
             style_path = os.path.join(assets_dir, 'style.css')
-            with open(style_path, 'w', encoding='utf-8') as f:
-                f.write(self.style_css)
+            self._write_file(style_path, self.style_css)
+            script_path = os.path.join(assets_dir, 'script.js')
+            self._write_file(script_path, self.js_script)
+        if self.lazy_payloads:
+            payloads_dir = os.path.join(assets_dir, 'payloads')
+            if not os.path.exists(payloads_dir):
+                os.makedirs(payloads_dir)
+            for key, payload in self.lazy_payloads.items():
+                payload_path = os.path.join(payloads_dir, '{}.js'.format(key))
+                self._write_file(
+                    payload_path,
+                    'lazyPayloadLoaded("{0}", {1});\n'.format(
+                        key,
+                        json_dumps(payload, self.json_backend),
+                    ),
+                    compress=False,
+                )
+
+    def _write_file(self, path, content, chunk_size=1024 * 1024,
+                    compress=True):
+        """Write the text content to the path, compressing it if configured.
+
+        The content is encoded and handed to the (possibly compressing) file
+        a chunk at a time, so a complete encoded copy of a large report never
+        has to exist alongside the text itself. Only the report and the assets
+        it refers to itself are compressed, so the files that are fetched by
+        the page, or linked to, are written as they are (``compress=False``).
+        Returns the path that was written to.
+        """
+        compression = self.compression if compress else None
+        f, path = open_output_file(path, compression)
+        with f:
+            for start in range(0, len(content), chunk_size):
+                chunk = content[start:start + chunk_size]
+                f.write(chunk.encode('utf-8', 'backslashreplace'))
+        return path
 
     def pytest_fixture_setup(self, fixturedef, request):
         fixturedef.param_index = request.param_index
 
     def pytest_runtest_logreport(self, report):
-        if report.passed:
-            self.append_passed(report)
-        elif report.failed:
-            self.append_failed(report)
-        elif report.skipped:
-            self.append_skipped(report)
-        else:
-            self.append_other(report)
+        with self._lock:
+            if report.passed:
+                self.append_passed(report)
+            elif report.failed:
+                self.append_failed(report)
+            elif report.skipped:
+                self.append_skipped(report)
+            else:
+                self.append_other(report)
+            if report.when == "teardown":
+                self._appendtiming(report)
+                self._appendfixtures(report)
+            self._appendnodeextras(report)
 
     def pytest_collectreport(self, report):
         if report.failed:
-            self.append_failed(report)
+            with self._lock:
+                self.append_failed(report)
 
     def pytest_sessionstart(self, session):
         self.suite_start_time = time.time()
+        if self.config.getoption('html_render_thread'):
+            self.rendering_thread = RenderingThread()
+            self.rendering_thread.start()
 
     def pytest_sessionfinish(self, session):
+        if self.rendering_thread is not None:
+            self.rendering_thread.finish()
+            self.rendering_thread = None
         report_content = self._generate_report(session)
         self._save_report(report_content)
+        if self.log_cache is not None:
+            self.log_cache.evict()
 
     def pytest_terminal_summary(self, terminalreporter):
         terminalreporter.write_sep('-', 'generated html file: {0}'.format(
             self.logfile))
 
 
+def get_deferred_outcomes(config):
+    """Get the outcomes of the tests that deferred extras are resolved for."""
+    outcomes = config.getoption('html_deferred_extras')
+    if outcomes.strip() == "all":
+        return set(OUTCOMES)
+    return set(o.strip().lower() for o in outcomes.split(",") if o.strip())
+
+
+def is_deferred_file(extra):
+    content = extra.get("content") if isinstance(extra, dict) else None
+    return isinstance(content, dict) and "deferred_path" in content
+
+
+def is_deferred_extra(extra):
+    content = extra.get("content") if isinstance(extra, dict) else None
+    return callable(content) or is_deferred_file(extra)
+
+
+def resolve_deferred_extra(extra, relevant):
+    """Resolve the deferred extra content if it's relevant, or drop it.
+
+    Content given as a function is replaced with what the function returns,
+    as it can't be sent up to the master. If the function fails (e.g. to take
+    a screenshot of a browser that crashed), the content is replaced with the
+    error instead. Deferred files are kept as they are, and are only read
+    once the report is generated, when everything that may write to them is
+    done.
+    """
+    resolved = []
+    for e in extra:
+        content = e.get("content") if isinstance(e, dict) else None
+        if callable(content):
+            if relevant:
+                try:
+                    resolved.append(dict(e, content=content()))
+                except Exception:
+                    resolved.append(extras.text(
+                        "Failed to get the extra content:\n{0}".format(
+                            traceback.format_exc(),
+                        ),
+                        name=e.get("name") or "Text",
+                    ))
+        elif not is_deferred_file(e) or relevant:
+            resolved.append(e)
+    return resolved
+
+
+def is_file_extra(extra):
+    content = extra.get("content") if isinstance(extra, dict) else None
+    return isinstance(content, dict) and "file_path" in content
+
+
+def b64encode_file(path, chunk_size=3 * 1024 * 1024):
+    """Base64 encode the content of the file, reading it a chunk at a time.
+
+    The chunks are a multiple of 3 bytes, so they're encoded without padding,
+    and the encoded chunks can just be joined.
+    """
+    chunks = []
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            chunks.append(b64encode(chunk).decode("ascii"))
+    return "".join(chunks)
+
+
+def get_image_source(content, report_dir):
+    """Get where the image can be read from to make a thumbnail of it.
+
+    Returns the base64 encoded data of an image embedded as a data URI, or
+    the path of an image file on this machine (relative paths being relative
+    to the report), and ``None`` for anything else.
+    """
+    if not isinstance(content, basestring):
+        return None
+    if content.startswith("data:"):
+        header, _, data = content.partition(",")
+        if header.endswith(";base64"):
+            return ("data", data)
+        return None
+    if "://" in content:
+        return None
+    path = os.path.join(report_dir, content)
+    if isfile(path):
+        return ("path", path)
+    return None
+
+
+def make_thumbnail(source, size):
+    """Make a PNG thumbnail of the image that's no larger than size pixels.
+
+    Returns ``None`` if Pillow can't read the image (e.g. an SVG). This is
+    run in the processes of a pool, so it only gets, and returns, what can be
+    pickled.
+    """
+    kind, value = source
+    if kind == "data":
+        value = BytesIO(b64decode(value))
+    try:
+        image = Image.open(value)
+        image.thumbnail((size, size))
+        if image.mode not in ("1", "L", "LA", "P", "RGB", "RGBA"):
+            image = image.convert("RGBA")
+        thumbnail = BytesIO()
+        image.save(thumbnail, "PNG")
+    except (IOError, OSError, ValueError):
+        return None
+    return thumbnail.getvalue()
+
+
+def read_deferred_file(extra):
+    """Get the extra content with the content of its deferred file.
+
+    Images are embedded as data URIs, JSON is parsed, and anything else is
+    read as text, as is JSON that can't be parsed (e.g. if the test didn't
+    get as far as finishing it). Returns ``None`` if the file can't be read
+    (e.g. if the test didn't get as far as writing it).
+    """
+    try:
+        with open(extra["content"]["deferred_path"], "rb") as f:
+            data = f.read()
+    except (IOError, OSError):
+        return None
+    if extra["format"] == extras.FORMAT_IMAGE:
+        content = "data:{0};base64,{1}".format(
+            extra["mime_type"],
+            b64encode(data).decode("ascii"),
+        )
+    else:
+        content = data.decode("utf-8", "replace")
+        if extra["format"] == extras.FORMAT_JSON:
+            try:
+                content = json.loads(content)
+            except ValueError:
+                return extras.text(content, name=extra["name"] or "Text")
+    return dict(extra, content=content)
+
+
+def get_extra_key(extra):
+    """Get a hash of the extra content, to tell apart distinct content."""
+    if isinstance(extra, dict):
+        extra = sorted(extra.items())
+    return hashlib.sha1(repr(extra).encode('utf-8')).hexdigest()
+
+
+def get_log_key(report):
+    """Get a hash of the raw content that the log of the report is made of."""
+    hash_generator = hashlib.sha1()
+
+    def update(text):
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8', 'backslashreplace')
+        hash_generator.update(text)
+        # separate the parts, so they can't be shifted between one another
+        hash_generator.update(b'\0')
+
+    update(report.longreprtext if report.longrepr else u'')
+    for header, content in report.sections:
+        update(header)
+        update(content)
+    return hash_generator.hexdigest()
+
+
+def build_search_index(results):
+    """Build an index of where each test is located in the results tree.
+
+    The index maps the node ID of each test to its path in the tree, i.e. the
+    index of each node along the way in the ``results``/``children`` lists of
+    its parent, and finally the index of the test in the ``test_results`` of
+    the last node. Both are kept in separate, parallel lists, so the report
+    can look tests up without having to render, or walk, the tree.
+    """
+    nodeids = []
+    paths = []
+
+    def index(node, path):
+        for i, test in enumerate(node["test_results"]):
+            nodeids.append(test["nodeid"])
+            paths.append(path + [i])
+        for i, child in enumerate(node["children"]):
+            index(child, path + [i])
+
+    for i, node in enumerate(results):
+        index(node, [i])
+    return {"nodeids": nodeids, "paths": paths}
+
+
+def split_lazy_payloads(results_tree):
+    """Move the logs and extras of the tests out of the results tree.
+
+    The logs and extras are only needed once a test is shown in the report,
+    so they're grouped by the module the tests are in, and each test is left
+    with a reference to its entry in the payload of its module. Each payload
+    also holds the logs its tests refer to, so the tree itself no longer
+    needs any. The tree is modified in place, and the payloads are returned,
+    keyed by a name that's unique to their module within the tree.
+
+    Tests that aren't inside a module (i.e. a node with a name ending in
+    ``.py``) are grouped with the other tests under the same top level node.
+    """
+    payloads = OrderedDict()
+    strings = results_tree.get("strings")
+    logs = results_tree.pop("logs")
+    results_tree["logs"] = {}
+
+    def split(node, path, key):
+        name = node["name"]
+        if strings is not None:
+            name = strings[name]
+        if key is None or name.endswith(".py"):
+            key = "-".join(str(i) for i in path)
+        for test in node["test_results"]:
+            payload = payloads.setdefault(key, {"logs": {}, "tests": []})
+            log_key = test.pop("log")
+            if log_key is not None:
+                payload["logs"][log_key] = logs[log_key]
+            test["payload"] = key
+            test["payload_index"] = len(payload["tests"])
+            payload["tests"].append({
+                "log": log_key,
+                "extra": test.pop("extra"),
+            })
+        for i, child in enumerate(node["children"]):
+            split(child, path + [i], key)
+
+    for i, node in enumerate(results_tree["results"]):
+        split(node, [i], None)
+    return payloads
+
+
 def get_namespace_chain(nodeid):
     try:
         param_start_index = nodeid.index("[")
@@ -805,6 +2613,16 @@ def get_namespace_chain(nodeid):
     return chain
 
 
+def normalize_nodeid(nodeid):
+    """Drop the ``::()`` instance part of the node id of a test in a class.
+
+    Older versions of pytest put it between the class and the test, so the
+    node ids the report shows (and the history is kept by) would otherwise
+    depend on the version of pytest.
+    """
+    return nodeid.replace("::()", "")
+
+
 def get_fixture_dependancies(name, fixturedefs):
     """Returns a set of the names of fixtures that the given fixture depends on.
 
@@ -825,6 +2643,24 @@ def get_fixture_dependancies(name, fixturedefs):
     return dependancies
 
 
+def get_fixture_param_description(fixturedef, param_index):
+    """Get the ID of the parameter of the fixture, or the parameter itself.
+
+    Returns ``None`` if the fixture isn't parameterized.
+    """
+    if not fixturedef.params:
+        return None
+    param_description = fixturedef.params[param_index]
+    if fixturedef.ids:
+        # assume iterable
+        try:
+            param_description = fixturedef.ids[param_index]
+        except TypeError:
+            # assume callable
+            param_description = fixturedef.ids(param_description)
+    return param_description
+
+
 def get_parameterized_fixtures_with_effective_autouse(item):
     """Get the parameterized fixtures, and determine if they are autouse.
 
@@ -858,11 +2694,13 @@ def get_parameterized_fixtures_with_effective_autouse(item):
     dependancies = {}
 
     complete_fixture_defs = item._fixtureinfo.name2fixturedefs
+    # tests that aren't parameterized at all don't have a callspec
+    callspec = getattr(item, "callspec", None)
+    indices = callspec.indices if callspec is not None else {}
 
     for fname, fixdef_list in complete_fixture_defs.items():
         fix = fixdef_list[-1]
         if fixture_is_or_inherits_autouse(fixdef_list):
-            fix.param_index = item.callspec.indices.get(fix.argname, 0)
             dependancies[fname] = get_fixture_dependancies(
                 fname,
                 complete_fixture_defs,
@@ -872,24 +2710,21 @@ def get_parameterized_fixtures_with_effective_autouse(item):
     param_fixtures = []
     for k, fixdef_list in complete_fixture_defs.items():
         fix = fixdef_list[-1]
-        if fix.params:
-            param_description = fix.params[fix.param_index]
-            if fix.ids:
-                # assume iterable
-                try:
-                    param_description = fix.ids[fix.param_index]
-                except TypeError:
-                    # assume callable
-                    param_description = fix.ids(param_description)
-        else:
-            param_description = None
+        # the index is taken from the test rather than kept on the fixture,
+        # which is shared, and may be on another parameter by the time the
+        # test is reported (e.g. from another thread)
+        param_index = indices.get(
+            fix.argname,
+            getattr(fix, "param_index", 0),
+        )
+        param_description = get_fixture_param_description(fix, param_index)
         autouse = fixture_is_or_inherits_autouse(
             complete_fixture_defs[fix.argname],
         )
         param_fix = {
             "name": fix.argname,
             "description": param_description,
-            "param_index": fix.param_index,
+            "param_index": param_index,
             "scopenum": fix.scopenum,
             "scope": fix.scope,
             "autouse": autouse,
@@ -1034,7 +2869,7 @@ def get_node_chain(item, outcome, duration):
         }
         if is_test:
             kwargs["location"] = item.location
-            kwargs["nodeid"] = item.nodeid
+            kwargs["nodeid"] = normalize_nodeid(item.nodeid)
             kwargs["outcome"] = outcome
             kwargs["duration"] = duration
 
@@ -1045,17 +2880,195 @@ def get_node_chain(item, outcome, duration):
     return node_chain
 
 
+def pop_user_property(report, name):
+    """Remove the user property from the report, and return its value.
+
+    In runs without ``pytest-xdist``, the ``user_properties`` of the reports
+    are those of their test item, so the properties only meant for the report
+    have to be removed once they're handled. Returns ``None`` if the report
+    doesn't have the property.
+    """
+    for prop in getattr(report, "user_properties", []):
+        if prop[0] == name:
+            report.user_properties.remove(prop)
+            return prop[1]
+    return None
+
+
+def describe_fixture(fixturedef, request):
+    """Describe the fixture, with its parameter shown as it is in the tree."""
+    param_index = getattr(request, "param_index", 0)
+    description = None
+    if fixturedef.params:
+        description = format_param_description(
+            get_fixture_param_description(fixturedef, param_index),
+        )
+    return {
+        "name": fixturedef.argname,
+        "description": description,
+        "param_index": param_index,
+        "baseid": fixturedef.baseid,
+        "scope": fixturedef.scope,
+    }
+
+
+@pytest.mark.hookwrapper
+def pytest_fixture_setup(fixturedef, request):
+    start = time.time()
+    yield
+    fixture = describe_fixture(fixturedef, request)
+    add_fixture_timing(
+        request.config,
+        dict(fixture, setup=time.time() - start),
+    )
+
+    def start_teardown():
+        # the finalizers are run last in, first out, so this one runs before
+        # those of the fixture itself, and pytest_fixture_post_finalizer is
+        # called once all of them are done
+        fixturedef._html_teardown_start = (time.time(), fixture)
+
+    fixturedef.addfinalizer(start_teardown)
+
+
+def pytest_fixture_post_finalizer(fixturedef, request):
+    started = getattr(fixturedef, "_html_teardown_start", None)
+    if started is None:
+        return
+    del fixturedef._html_teardown_start
+    start, fixture = started
+    add_fixture_timing(
+        request.config,
+        dict(fixture, teardown=time.time() - start),
+    )
+
+
+# guards the state kept on the config while the tests run, which the threads
+# of thread based runners (e.g. pytest-parallel) share
+_run_state_lock = threading.RLock()
+
+
+def get_pending_fixture_timings(config):
+    """Get the fixture timings that weren't sent with a report yet."""
+    if not hasattr(config, "_html_fixture_timings"):
+        config._html_fixture_timings = []
+    return config._html_fixture_timings
+
+
+def add_fixture_timing(config, timing):
+    with _run_state_lock:
+        get_pending_fixture_timings(config).append(timing)
+
+
+def take_fixture_timings(config):
+    """Get the pending fixture timings, and forget them."""
+    with _run_state_lock:
+        fixture_timings = get_pending_fixture_timings(config)
+        taken = list(fixture_timings)
+        del fixture_timings[:]
+    return taken
+
+
+def record_test_timing(item, call, report):
+    """Keep track of when the test ran, and how long each of its phases took.
+
+    Once the test is torn down, its timing (including the worker it ran on,
+    if ``pytest-xdist`` is used) is added to the ``user_properties`` of the
+    teardown report, so the master can add it to the node of the test, and to
+    the timeline of the worker.
+    """
+    timing = getattr(item, "_html_timing", None)
+    if timing is None:
+        slaveinput = getattr(item.config, "slaveinput", {})
+        timing = item._html_timing = {
+            "worker": slaveinput.get("slaveid", "master"),
+            "start": call.start,
+            "phases": {},
+        }
+    timing["phases"][report.when] = getattr(report, "duration", 0.0)
+    timing["stop"] = call.stop
+    if report.when == "teardown":
+        del item._html_timing
+        report.user_properties.append((
+            "pytest_html_report_test_timing",
+            timing,
+        ))
+        # every fixture is set up, and torn down, during one of the phases of
+        # a test, so the ones timed since the last test go with this one
+        report.user_properties.append((
+            "pytest_html_report_fixture_durations",
+            take_fixture_timings(item.config),
+        ))
+
+
 @pytest.mark.hookwrapper
 def pytest_runtest_makereport(item, call):
+    outcome = yield
+    report = outcome.get_result()
+    record_test_timing(item, call, report)
+    if getattr(report, "extra", None):
+        report.extra = resolve_deferred_extra(
+            report.extra,
+            is_relevant_outcome(item.config, get_report_outcome(report)),
+        )
+    if collects_node_extras(item.config):
+        collect_node_extras(item, report)
+    add_node_chain(item, report)
+
+
+def pytest_runtest_teardown(item, nextitem):
+    # once the last test is torn down, every node is done
+    item._html_last = nextitem is None
+
+
+def add_node_chain(item, report):
+    """Add the node chain of the test to the first report with an outcome."""
     for prop in item.user_properties:
         if isinstance(prop, tuple):
             if prop[0] == "pytest_html_report_node_chain":
-                yield
                 return
 
-    outcome = yield
-    report = outcome.get_result()
+    outcome = get_report_outcome(report)
+    if outcome is None:
+        return
 
+    duration = getattr(report, "duration", 0.0)
+    relevant = is_relevant_outcome(item.config, outcome)
+
+    node_chain = get_node_chain(item, outcome, duration)
+    if collects_node_extras(item.config):
+        with _run_state_lock:
+            open_nodes = get_open_nodes(item.config)
+            for index, node in enumerate(node_chain[:-1]):
+                if index == len(open_nodes):
+                    open_nodes.append((node, []))
+                tests = open_nodes[index][1]
+                if node_chain[-1] not in tests:
+                    tests.append(node_chain[-1])
+
+    extra = getattr(report, "extra", [])
+
+    item.config.hook.pytest_html_add_node_chain_extra(
+        item=item,
+        outcome=outcome,
+        extra=extra,
+        node_chain=node_chain,
+    )
+    report.user_properties.append((
+        "pytest_html_report_node_chain",
+        list(
+            node.to_serializable_node_chain_link(relevant)
+            for node in node_chain
+        ),
+    ))
+
+
+def get_report_outcome(report):
+    """Get the outcome of the test the report is for, if it has one yet.
+
+    Only the first report of a test with an outcome is added to the results
+    tree, e.g. a passing setup doesn't decide the outcome of the test.
+    """
     outcome = None
 
     wasxfail = hasattr(report, "wasxfail")
@@ -1078,22 +3091,104 @@ def pytest_runtest_makereport(item, call):
     elif report.failed:
         outcome = "Error"
 
-    if outcome is None:
-        return
+    return outcome
 
-    duration = getattr(report, "duration", 0.0)
 
-    node_chain = get_node_chain(item, outcome, duration)
+def is_relevant_outcome(config, outcome):
+    """Check if deferred extra content is resolved for the outcome."""
+    return (outcome or "passed").lower() in get_deferred_outcomes(config)
 
-    extra = getattr(report, "extra", [])
 
-    item.config.hook.pytest_html_add_node_chain_extra(
-        item=item,
-        outcome=outcome,
-        extra=extra,
-        node_chain=node_chain,
+def collects_node_extras(config):
+    """Check if any plugin implements ``pytest_html_collect_node_extras``.
+
+    The plugins are checked themselves, as the hook callers of the versions of
+    pluggy that pytest 3.0 supports can't list their implementations.
+    """
+    return any(
+        hasattr(plugin, 'pytest_html_collect_node_extras')
+        for plugin in config.pluginmanager.get_plugins()
     )
+
+
+def get_open_nodes(config):
+    """Get the nodes the last test was in, with the tests run in each so far.
+
+    The nodes are in the order of the node chain of the test, and are only
+    kept for as long as the tests that follow are in them.
+    """
+    if not hasattr(config, "_html_open_nodes"):
+        config._html_open_nodes = []
+    return config._html_open_nodes
+
+
+def get_finished_node_count(open_nodes, item):
+    """Get how many of the open nodes the test is in.
+
+    The test is in an open node if the group at the same depth of its node
+    chain has the same name, and the same parameters. Once it isn't in one, it
+    isn't in any of the deeper ones either.
+    """
+    param_fixtures = get_parameterized_fixtures_with_effective_autouse(item)
+    groups = get_parameterized_simple_node_chain(item, param_fixtures)[:-1]
+    depth = 0
+    for index, (node, _) in enumerate(open_nodes):
+        if node.is_xdist_slave:
+            continue
+        if depth >= len(groups) or groups[depth]["name"] != node.name:
+            return index
+        params = [
+            (p["name"], p["param_index"], p["baseid"])
+            for p in groups[depth]["params"]
+        ]
+        if params != [(p.name, p.param_index, p.baseid) for p in node.params]:
+            return index
+        depth += 1
+    return len(open_nodes)
+
+
+def collect_node_extras(item, report):
+    """Let plugins add extra content to the nodes that all tests are done in.
+
+    When a test is set up, the nodes the last test was in, but it isn't, are
+    done. Once the last test is torn down, all of them are.
+    ``pytest_html_collect_node_extras`` is called once for each of those
+    nodes, innermost first, with the tests that ran in it, and the extra
+    content added to them is sent up with the report. If the tests of a node
+    don't run one after the other (e.g. with the ``load`` scheduling of
+    ``pytest-xdist``), this happens each time a run of them ends, with the
+    tests of that run.
+    """
+    # the report this was sent with has been handled already
+    pop_user_property(item, "pytest_html_report_node_extras")
+
+    with _run_state_lock:
+        _collect_finished_node_extras(item, report)
+
+
+def _collect_finished_node_extras(item, report):
+    open_nodes = get_open_nodes(item.config)
+    if report.when == "setup":
+        index = get_finished_node_count(open_nodes, item)
+    elif report.when == "teardown" and getattr(item, "_html_last", False):
+        index = 0
+    else:
+        return
+    if index == len(open_nodes):
+        return
+
+    node_chain = [node for node, _ in open_nodes]
+    relevant = False
+    for node, tests in reversed(open_nodes[index:]):
+        item.config.hook.pytest_html_collect_node_extras(
+            node=node,
+            tests=tests,
+        )
+        relevant = relevant or any(
+            is_relevant_outcome(item.config, t.outcome) for t in tests
+        )
+    del open_nodes[index:]
     report.user_properties.append((
-        "pytest_html_report_node_chain",
-        list(node.to_serializable_node_chain_link() for node in node_chain),
+        "pytest_html_report_node_extras",
+        list(n.to_serializable_node_chain_link(relevant) for n in node_chain),
     ))
@@ -23,6 +23,14 @@ function get_query_parameter(name) {
 }
 
 
+// rendered elements that carry each outcome, so toggling the visibility of an
+// outcome only has to touch the elements it concerns
+outcomeIndex = {};
+for (let o of Object.keys(shown_states)) {
+    outcomeIndex[o] = new Set();
+}
+
+
 function toggleShownState() {
     var outcome = null
     for (let o of Object.keys(shown_states)) {
@@ -32,80 +40,533 @@ function toggleShownState() {
         }
     }
     shown_states[outcome] = !shown_states[outcome]
-    updateOutcomeCountVisibility(outcome)
-    updateTestVisibility()
+    updateOutcomeVisibility(outcome)
 
 }
 
-function updateOutcomeCountVisibility(outcome=null) {
-    var outcomes = outcome ? [outcome] : Object.keys(shown_states);
+function registerOutcomeElement(el, outcomes) {
+    el.outcomes = outcomes.filter(o => o in outcomeIndex);
+    for (let o of el.outcomes) {
+        outcomeIndex[o].add(el);
+    }
+    updateElementVisibility(el);
+}
 
-    for (let k of outcomes) {
-        for (let el of document.querySelectorAll(`.${k}`)) {
-            if (shown_states[k]) {
-                el.classList.add("shown")
-            } else {
-                el.classList.remove("shown")
-            }
+function unregisterOutcomeElements(container) {
+    // forget the elements inside a container that is being removed
+    for (let el of container.querySelectorAll("li, .summary-result-count")) {
+        if (el.outcomes === undefined) {
+            continue;
+        }
+        for (let o of el.outcomes) {
+            outcomeIndex[o].delete(el);
         }
     }
 }
 
-function updateTestVisibility() {
+function updateElementVisibility(el) {
+    // an element is shown as long as any of its outcomes are shown
+    if (el.outcomes.some(o => shown_states[o])) {
+        el.classList.add("shown");
+    } else {
+        el.classList.remove("shown");
+    }
+}
+
+function updateOutcomeVisibility(outcome) {
+    for (let el of outcomeIndex[outcome]) {
+        updateElementVisibility(el);
+    }
+}
+
+
+
+function init () {
+    collapsed = (get_query_parameter('collapsed') || "passed").toLowerCase().split(",");
+
+    loadResultsTree().then(function () {
+        prepareResultsHeaders();
+    });
+
+};
 
-    var true_keys = [];
-    var false_keys = [];
 
-    for (let k of Object.keys(shown_states)) {
-        if (shown_states[k]) {
-            true_keys.push(k);
+function loadResultsTree() {
+    if (typeof resultsApi !== "undefined") {
+        // served by pytest-html-serve, so the nodes are only fetched as they
+        // are opened
+        return fetchRemotePage("nodes", null, 0).then(function (page) {
+            var tree = {
+                results: page.items,
+                remote_id: null,
+                children: page.items,
+                child_count: page.total,
+            };
+            resultsTree = tree;
+            return resultsTree;
+        });
+    }
+    if (typeof resultsTreeCompressed === "undefined" || resultsTreeCompressed === null) {
+        // the results were parsed along with the script
+        if (resultsTree.format === "columnar") {
+            resultsTree = decodeColumnarResultsTree(resultsTree);
+        }
+        return Promise.resolve(resultsTree);
+    }
+    var encoded = resultsTreeCompressed;
+    // the encoded copy isn't needed anymore, so let it be garbage collected
+    resultsTreeCompressed = null;
+    return prepareResultsInWorker(encoded).catch(function () {
+        // workers may not be allowed to start (e.g. by a content security
+        // policy), so the results are prepared here instead
+        return prepareResults(encoded, remotePageSize);
+    }).then(function (prepared) {
+        resultsTree = loadPreparedResults(prepared);
+        return resultsTree;
+    });
+}
+
+
+function inflatePayload(encoded) {
+    // the results were embedded deflated and base64 encoded, so they have to
+    // be inflated before they can be parsed
+    var bytes = decodeBase64(encoded);
+    var stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("deflate"));
+    return new Response(stream).text().then(text => JSON.parse(text));
+}
+
+
+function prepareResults(encoded, pageSize) {
+    // does everything to load the results that doesn't need the page, so it
+    // can be done by a worker: the results are laid out in columns, and their
+    // text is packed into buffers, so all of it can be moved to the page
+    // rather than copied, along with the first page of the rows it shows
+    return inflatePayload(encoded).then(function (payload) {
+        var rows = payload.format === "columnar" ? decodeColumns(payload) : flattenResultsTree(payload);
+        var topRows = [];
+        for (var i = 0; i < rows.columns.parent.length; i++) {
+            if (rows.columns.parent[i] < 0) {
+                topRows.push(i);
+            }
+        }
+        return {
+            name: payload.name,
+            summary: payload.summary,
+            phase_durations: payload.phase_durations,
+            suite_info: payload.suite_info,
+            outcomes: rows.outcomes,
+            phases: rows.phases,
+            columns: rows.columns,
+            childNodes: rows.childNodes,
+            childTests: rows.childTests,
+            strings: packStrings(rows.strings),
+            logs: packStrings(rows.logs),
+            extras: packStrings(rows.extras.map(e => JSON.stringify(e))),
+            search_index: {
+                nodeids: packStrings(payload.search_index.nodeids),
+                paths: packPaths(payload.search_index.paths),
+            },
+            topRows: Int32Array.from(topRows),
+            firstRows: topRows.slice(0, pageSize).map(r => renderRow(rows, r)),
+        };
+    });
+}
+
+
+function flattenResultsTree(payload) {
+    // lays the nested results out in columns, the same way as the columnar
+    // format, with the tests of each node before its children
+    var outcomes = ["passed", "skipped", "failed", "error", "xfailed", "xpassed"];
+    var phases = ["setup", "call", "teardown"];
+    var columns = {};
+    for (let c of ["parent", "name", "param_description", "nodeid", "location", "outcome", "duration", "phase_durations", "baseline_duration", "regression", "log", "extra", "summary", "is_xdist_slave", "payload", "payload_index"]) {
+        columns[c] = [];
+    }
+    var strings = [];
+    var stringIndexes = new Map();
+    var intern = function (value) {
+        if (typeof value === "number") {
+            // the strings of an interned payload are in its own table
+            value = value >= 0 ? payload.strings[value] : null;
+        }
+        if (value === null || value === undefined) {
+            return -1;
+        }
+        if (!stringIndexes.has(value)) {
+            stringIndexes.set(value, strings.push(value) - 1);
+        }
+        return stringIndexes.get(value);
+    };
+    var logs = [];
+    var logIndexes = new Map();
+    var extras = [];
+
+    var addRow = function (node, parent, isTest) {
+        var row = columns.parent.push(parent) - 1;
+        columns.name.push(intern(node.name));
+        columns.param_description.push(intern(node.param_description));
+        columns.duration.push(parseFloat(node.duration));
+        for (let p of phases) {
+            columns.phase_durations.push(parseFloat(node.phase_durations[p]));
+        }
+        columns.baseline_duration.push(node.baseline === null ? NaN : parseFloat(node.baseline));
+        columns.regression.push(node.regression ? 1 : 0);
+        columns.is_xdist_slave.push(node.is_xdist_slave ? 1 : 0);
+        columns.extra.push(node.extra && node.extra.length ? extras.push(node.extra) - 1 : -1);
+        if (isTest) {
+            var location = node.location;
+            columns.nodeid.push(intern(node.nodeid));
+            columns.location.push(intern(Array.isArray(location) ? location.join(",") : location || "Unknown"));
+            columns.outcome.push(intern(node.outcome));
+            if (node.log === null || node.log === undefined) {
+                columns.log.push(-1);
+            } else {
+                if (!logIndexes.has(node.log)) {
+                    logIndexes.set(node.log, logs.push(payload.logs[node.log]) - 1);
+                }
+                columns.log.push(logIndexes.get(node.log));
+            }
+            // the logs and extra content of the tests may be left to load
+            // lazily, from the file of their module
+            columns.payload.push(node.payload === undefined ? -1 : intern(node.payload));
+            columns.payload_index.push(node.payload === undefined ? -1 : node.payload_index);
+            for (let o of outcomes) {
+                columns.summary.push(0);
+            }
         } else {
-            false_keys.push(k)
+            for (let c of ["nodeid", "location", "outcome", "log", "payload", "payload_index"]) {
+                columns[c].push(-1);
+            }
+            for (let o of outcomes) {
+                columns.summary.push(node.summary[o]);
+            }
+        }
+        return row;
+    };
+    var addNode = function (node, parent) {
+        var row = addRow(node, parent, false);
+        for (let test of node.test_results) {
+            addRow(test, row, true);
         }
+        for (let child of node.children) {
+            addNode(child, row);
+        }
+    };
+    for (let node of payload.results) {
+        addNode(node, -1);
     }
 
-    var selectorList = [];
-    var filter = "";
+    var floatColumns = ["duration", "phase_durations", "baseline_duration"];
+    for (let c of Object.keys(columns)) {
+        columns[c] = floatColumns.includes(c) ? Float64Array.from(columns[c]) : Int32Array.from(columns[c]);
+    }
+    return indexRows(columns, {
+        outcomes: outcomes,
+        phases: phases,
+        strings: strings,
+        logs: logs,
+        extras: extras,
+    });
+}
 
-    for (let k of true_keys){
-        filter += `:not(.${k})`;
+
+function packStrings(strings) {
+    // joins the strings into one UTF-8 encoded buffer, which can be moved
+    // rather than copied, with the offsets of each of them in the joined text
+    var offsets = new Int32Array(strings.length + 1);
+    for (var i = 0; i < strings.length; i++) {
+        offsets[i + 1] = offsets[i] + strings[i].length;
     }
+    return {text: new TextEncoder().encode(strings.join("")), offsets: offsets};
+}
 
-    for (let k of false_keys) {
-        selectorList.push(`li.${k}${filter}`);
+function unpackStrings(packed) {
+    // the text is decoded as a whole, and the strings are only sliced out of
+    // it, so nothing has to be parsed
+    var text = new TextDecoder().decode(packed.text);
+    var strings = new Array(packed.offsets.length - 1);
+    for (var i = 0; i < strings.length; i++) {
+        strings[i] = text.slice(packed.offsets[i], packed.offsets[i + 1]);
     }
-    var hideSelector = selectorList.join();
+    return strings;
+}
 
-    if (hideSelector) {
-        for (let el of document.querySelectorAll(hideSelector)) {
-            el.classList.remove("shown");
-        }
+function packPaths(paths) {
+    // the paths are packed the same way as the children of the rows, so the
+    // path of a test is rows.subarray(offsets[test], offsets[test + 1])
+    var offsets = new Int32Array(paths.length + 1);
+    for (var i = 0; i < paths.length; i++) {
+        offsets[i + 1] = offsets[i] + paths[i].length;
+    }
+    var rows = new Int32Array(offsets[paths.length]);
+    for (var i = 0; i < paths.length; i++) {
+        rows.set(paths[i], offsets[i]);
     }
+    return {offsets: offsets, rows: rows};
+}
+
+
+// the functions the worker is made of, which can't refer to anything else in
+// the page, as the worker doesn't share its scope
+resultsWorkerFunctions = [
+    decodeBase64,
+    buildChildIndex,
+    decodeColumns,
+    indexRows,
+    renderRow,
+    inflatePayload,
+    prepareResults,
+    flattenResultsTree,
+    packStrings,
+    packPaths,
+    handlePrepareRequest,
+];
+
+function handlePrepareRequest(e) {
+    // runs in the worker, posting the prepared results back to the page, with
+    // all of their buffers moved rather than copied
+    prepareResults(e.data.payload, e.data.pageSize).then(function (prepared) {
+        var buffers = [prepared.topRows.buffer];
+        for (let c of Object.keys(prepared.columns)) {
+            buffers.push(prepared.columns[c].buffer);
+        }
+        for (let index of [prepared.childNodes, prepared.childTests, prepared.search_index.paths]) {
+            buffers.push(index.offsets.buffer, index.rows.buffer);
+        }
+        for (let packed of [prepared.strings, prepared.logs, prepared.extras, prepared.search_index.nodeids]) {
+            buffers.push(packed.text.buffer, packed.offsets.buffer);
+        }
+        postMessage(prepared, buffers);
+    }, function (error) {
+        postMessage({error: String(error)});
+    });
+}
+
+function prepareResultsInWorker(encoded) {
+    // the worker is started from the source of its functions rather than a
+    // file, so it also works for self-contained reports, and ones opened from
+    // the file system
+    return new Promise(function (resolve, reject) {
+        if (typeof Worker === "undefined") {
+            throw new Error("workers aren't supported");
+        }
+        var source = resultsWorkerFunctions.map(f => f.toString()).join("\n\n");
+        source += "\n\nonmessage = handlePrepareRequest;\n";
+        var url = URL.createObjectURL(new Blob([source], {type: "text/javascript"}));
+        try {
+            var worker = new Worker(url);
+        } finally {
+            URL.revokeObjectURL(url);
+        }
+        worker.onmessage = function (e) {
+            worker.terminate();
+            if (e.data.error !== undefined) {
+                reject(new Error(e.data.error));
+            } else {
+                resolve(e.data);
+            }
+        };
+        worker.onerror = function (e) {
+            worker.terminate();
+            reject(e);
+        };
+        worker.postMessage({payload: encoded, pageSize: remotePageSize});
+    });
+}
+
+function loadPreparedResults(prepared) {
+    // only the text of the prepared results has to be unpacked, the rows are
+    // looked up in the columns as they're shown
+    var rows = {
+        columns: prepared.columns,
+        childNodes: prepared.childNodes,
+        childTests: prepared.childTests,
+        outcomes: prepared.outcomes,
+        phases: prepared.phases,
+        strings: unpackStrings(prepared.strings),
+        logs: unpackStrings(prepared.logs),
+        extras: unpackStrings(prepared.extras),
+    };
+    return {
+        name: prepared.name,
+        format: "columnar",
+        summary: prepared.summary,
+        phase_durations: prepared.phase_durations,
+        suite_info: prepared.suite_info,
+        search_index: {
+            nodeids: unpackStrings(prepared.search_index.nodeids),
+            paths: prepared.search_index.paths,
+        },
+        logs: rows.logs,
+        results: Array.from(prepared.topRows, (r, i) => columnarNode(rows, r, prepared.firstRows[i])),
+    };
+}
+
 
-    showSelectorList = [];
-    for (let k of true_keys){
-        showSelectorList.push(`li.${k}`);
+function resolveString(value) {
+    // strings of an interned payload are only looked up once they are shown
+    if (typeof value === "number") {
+        return value >= 0 ? resultsTree.strings[value] : "";
     }
+    return value;
+}
 
-    showSelector = showSelectorList.join();
 
-    if (showSelector) {
-        for (let el of document.querySelectorAll(showSelector)) {
-            el.classList.add("shown")
+function decodeBase64(encoded) {
+    var binary = atob(encoded);
+    var bytes = new Uint8Array(binary.length);
+    for (var i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return bytes;
+}
+
+function buildChildIndex(parent, include) {
+    // group the rows by their parent, keeping their order, so the children of
+    // a row are rows.subarray(offsets[row], offsets[row + 1])
+    var n = parent.length;
+    var offsets = new Int32Array(n + 1);
+    for (var i = 0; i < n; i++) {
+        if (parent[i] >= 0 && include(i)) {
+            offsets[parent[i] + 1]++;
+        }
+    }
+    for (var i = 0; i < n; i++) {
+        offsets[i + 1] += offsets[i];
+    }
+    var rows = new Int32Array(offsets[n]);
+    var fill = offsets.slice(0, n);
+    for (var i = 0; i < n; i++) {
+        if (parent[i] >= 0 && include(i)) {
+            rows[fill[parent[i]]++] = i;
         }
     }
+    return {offsets: offsets, rows: rows};
 }
 
+function decodeColumns(payload) {
+    // decode the columns of a columnar payload
+    var columns = {};
+    for (let c of Object.keys(payload.columns)) {
+        var buffer = decodeBase64(payload.columns[c]).buffer;
+        columns[c] = payload.column_types[c] === "d" ? new Float64Array(buffer) : new Int32Array(buffer);
+    }
+    return indexRows(columns, payload);
+}
 
+function indexRows(columns, tables) {
+    // index the children of each row, which are kept with the columns, and
+    // the tables they refer to
+    var isTest = i => columns.outcome[i] >= 0;
+    return {
+        columns: columns,
+        childNodes: buildChildIndex(columns.parent, i => !isTest(i)),
+        childTests: buildChildIndex(columns.parent, isTest),
+        outcomes: tables.outcomes,
+        phases: tables.phases,
+        strings: tables.strings,
+        logs: tables.logs,
+        extras: tables.extras,
+    };
+}
 
-function init () {
-    collapsed = (get_query_parameter('collapsed') || "passed").toLowerCase().split(",");
+function decodeColumnarResultsTree(payload) {
+    var rows = decodeColumns(payload);
+    var results = [];
+    for (var i = 0; i < rows.columns.parent.length; i++) {
+        if (rows.columns.parent[i] < 0) {
+            results.push(columnarNode(rows, i));
+        }
+    }
+    return {
+        name: payload.name,
+        format: payload.format,
+        summary: payload.summary,
+        phase_durations: payload.phase_durations,
+        suite_info: payload.suite_info,
+        search_index: payload.search_index,
+        logs: payload.logs,
+        results: results,
+    };
+}
 
-    prepareResultsHeaders();
-    updateOutcomeCountVisibility();
-    updateTestVisibility();
+function renderRow(rows, row) {
+    // works out what is shown for a row, other than its children, and the
+    // log and extra content that are only looked up once they're shown
+    var columns = rows.columns;
+    var string = i => i >= 0 ? rows.strings[i] : "";
+    var baseline = columns.baseline_duration[row];
+    var rendered = {
+        name: string(columns.name[row]),
+        param_description: string(columns.param_description[row]),
+        duration: columns.duration[row].toFixed(2),
+        phase_durations: {},
+        baseline: isNaN(baseline) ? null : baseline.toFixed(2),
+        regression: columns.regression[row] == 1,
+        is_xdist_slave: columns.is_xdist_slave[row] == 1,
+    };
+    var start = row * rows.phases.length;
+    for (var i = 0; i < rows.phases.length; i++) {
+        rendered.phase_durations[rows.phases[i]] = columns.phase_durations[start + i].toFixed(2);
+    }
+    if (columns.outcome[row] >= 0) {
+        rendered.nodeid = string(columns.nodeid[row]);
+        rendered.location = string(columns.location[row]);
+        rendered.outcome = string(columns.outcome[row]);
+        if (columns.payload !== undefined && columns.payload[row] >= 0) {
+            rendered.payload = string(columns.payload[row]);
+            rendered.payload_index = columns.payload_index[row];
+        }
+    } else {
+        rendered.summary = {};
+        var summaryStart = row * rows.outcomes.length;
+        for (var i = 0; i < rows.outcomes.length; i++) {
+            rendered.summary[rows.outcomes[i]] = columns.summary[summaryStart + i];
+        }
+        rendered.outcomes = rows.outcomes.filter(o => rendered.summary[o] > 0);
+    }
+    return rendered;
+}
 
-};
+function columnarNode(rows, row, rendered) {
+    // presents a row of the columns the same way as a node of the nested
+    // format, only working out what is shown for it once it's needed
+    var columns = rows.columns;
+    var related = {};
+    var rowsOf = function (index) {
+        var children = index.rows.subarray(index.offsets[row], index.offsets[row + 1]);
+        return Array.from(children, r => columnarNode(rows, r));
+    };
+    var node = {
+        get log() { return columns.log[row]; },
+        get extra() {
+            if (related.extra === undefined) {
+                var extra = columns.extra[row] >= 0 ? rows.extras[columns.extra[row]] : [];
+                // the extra content of prepared results is kept as JSON
+                related.extra = typeof extra === "string" ? JSON.parse(extra) : extra;
+            }
+            return related.extra;
+        },
+        get children() {
+            return related.children || (related.children = rowsOf(rows.childNodes));
+        },
+        get test_results() {
+            return related.test_results || (related.test_results = rowsOf(rows.childTests));
+        },
+    };
+    for (let key of ["name", "param_description", "nodeid", "location", "outcome", "duration", "phase_durations", "baseline", "regression", "is_xdist_slave", "summary", "outcomes", "payload", "payload_index"]) {
+        Object.defineProperty(node, key, {
+            get: function () {
+                if (rendered === undefined) {
+                    rendered = renderRow(rows, row);
+                }
+                return rendered[key];
+            },
+            enumerable: true,
+        });
+    }
+    return node;
+}
 
 
 function toggleOpenClass() {
@@ -116,7 +577,75 @@ function toggleOpenTrigger() {
     toggleOpen(this);
 }
 
+remotePageSize = 100;
+
+function shownOutcomesFilter() {
+    // the outcomes the server only has to send the tests of, or "" for all
+    var outcomes = Object.keys(shown_states);
+    var shown = outcomes.filter(o => shown_states[o]);
+    return shown.length === outcomes.length || !shown.length ? "" : shown.join(",");
+}
+
+function fetchRemotePage(kind, parent, offset, outcomes) {
+    var url = `${resultsApi}/${kind}?offset=${offset}&limit=${remotePageSize}`;
+    if (parent !== null) {
+        url += `&parent=${parent}`;
+    }
+    if (outcomes) {
+        url += `&outcome=${outcomes}`;
+    }
+    return fetch(url).then(response => response.json());
+}
+
+function loadRemoteChildren(data) {
+    // the tests are fetched again once other outcomes are shown
+    var outcomes = shownOutcomesFilter();
+    if (data.loading === undefined || data.loading_outcomes !== outcomes) {
+        data.loading_outcomes = outcomes;
+        data.loading = Promise.all([
+            data.child_count ? fetchRemotePage("nodes", data.remote_id, 0) : {items: []},
+            data.test_count ? fetchRemotePage("tests", data.remote_id, 0, outcomes) : {items: [], total: 0},
+        ]).then(function (pages) {
+            data.children = pages[0].items;
+            data.test_results = pages[1].items;
+            data.test_total = pages[1].total;
+            data.test_outcomes = outcomes;
+        });
+    }
+    return data.loading;
+}
+
+function appendMoreButton(ul, data, kind, create) {
+    // only a page of the children of a remote node is fetched at a time
+    var loaded = kind === "nodes" ? data.children : data.test_results;
+    var total = kind === "nodes" ? data.child_count : data.test_total;
+    if (data.remote_id === undefined || loaded.length >= total) {
+        return;
+    }
+    var li = document.createElement("li");
+    li.classList.add("load-more");
+    li.innerText = `Show more (${total - loaded.length} left)`;
+    li.addEventListener("click", function () {
+        ul.removeChild(li);
+        var outcomes = kind === "tests" ? data.test_outcomes : "";
+        fetchRemotePage(kind, data.remote_id, loaded.length, outcomes).then(function (page) {
+            for (let item of page.items) {
+                loaded.push(item);
+                ul.appendChild(create(item));
+            }
+            appendMoreButton(ul, data, kind, create);
+        });
+    }, false);
+    ul.appendChild(li);
+}
+
 function toggleOpen(nodeLink) {
+    var data = nodeLink.parentNode.data;
+    if (data.remote_id !== undefined && !nodeLink.classList.contains("active") &&
+            (data.children === undefined || data.test_outcomes !== shownOutcomesFilter())) {
+        loadRemoteChildren(data).then(() => toggleOpen(nodeLink));
+        return;
+    }
     if (!nodeLink.parentNode.data.children.length && !nodeLink.parentNode.data.test_results.length) {
         // nothing to show or hide
         return;
@@ -124,7 +653,9 @@ function toggleOpen(nodeLink) {
     if (nodeLink.classList.contains("active")) {
         // already active so remove children after hiding them
         nodeLink.classList.toggle("active");
-        nodeLink.parentNode.removeChild(nodeLink.parentNode.querySelector("div.child-containers"));
+        var removed = nodeLink.parentNode.querySelector("div.child-containers");
+        unregisterOutcomeElements(removed);
+        nodeLink.parentNode.removeChild(removed);
         return;
     }
     var child_containers = document.createElement("div");
@@ -140,6 +671,7 @@ function toggleOpen(nodeLink) {
         for (var i = 0; i < nodeLink.parentNode.data.children.length; i++) {
             ul.appendChild(createNodeHeader(nodeLink.parentNode.data.children[i], !nodeLink.parentNode.odd));
         }
+        appendMoreButton(ul, data, "nodes", child => createNodeHeader(child, !nodeLink.parentNode.odd));
         child_containers.appendChild(ul);
     }
 
@@ -151,11 +683,10 @@ function toggleOpen(nodeLink) {
 
             ul.appendChild(li)
         }
+        appendMoreButton(ul, data, "tests", createTestDesc);
         child_containers.appendChild(ul);
     }
     nodeLink.parentNode.appendChild(child_containers);
-    updateOutcomeCountVisibility()
-    updateTestVisibility()
 
     nodeLink.classList.toggle("active");
 
@@ -168,9 +699,15 @@ function prepareResultsHeaders() {
     for (let c of document.querySelectorAll(".summary-details .count-toggle-button")) {
         c.addEventListener('click', toggleShownState, false);
     }
+    for (let o of Object.keys(shown_states)) {
+        for (let el of document.querySelectorAll(`.summary-details .${o}`)) {
+            registerOutcomeElement(el, [o]);
+        }
+    }
 
     document.querySelector("#expand-all-button").addEventListener('click', expandAll, false);
     document.querySelector("#collapse-all-button").addEventListener('click', collapseAll, false);
+    document.querySelector("#search-input").addEventListener('input', searchTests, false);
 
     var resultsContainer = document.createElement("div");
     resultsContainer.setAttribute("class", "results");
@@ -180,12 +717,11 @@ function prepareResultsHeaders() {
     for (var i = 0; i < resultsTree.results.length; i++) {
         resultsContainerUl.appendChild(createNodeHeader(resultsTree.results[i]));
     }
+    appendMoreButton(resultsContainerUl, resultsTree, "nodes", createNodeHeader);
     resultsInfoDiv = document.body.querySelector(".results-info")
     resultsContainer.appendChild(resultsContainerUl)
     resultsInfoDiv.appendChild(resultsContainer)
 
-    updateOutcomeCountVisibility()
-
 }
 
 
@@ -193,20 +729,21 @@ function createNodeHeader(nodeDetails, odd=false) {
 
     var summary_container = document.createElement("li");
     summary_container.setAttribute("class", `results-summary-container ${odd ? 'odd' : 'even'}`);
-    for (let k of Object.keys(nodeDetails.summary)) {
-        if (nodeDetails.summary[k] > 0) {
-            summary_container.classList.add(k);
-        }
+    // the outcomes are usually worked out while the results are prepared
+    var outcomes = nodeDetails.outcomes || Object.keys(nodeDetails.summary).filter(k => nodeDetails.summary[k] > 0);
+    for (let k of outcomes) {
+        summary_container.classList.add(k);
     }
     summary_container.data = nodeDetails
+    var paramDescription = resolveString(nodeDetails.param_description);
     summary_container.innerHTML = `
         <div class="results-summary-container-header">
             <div class="node-level-description">
-                    <div class="name">${nodeDetails.name}</div>
-                    <div class="params">${nodeDetails.param_description ? "[" + nodeDetails.param_description + "]" : ""}</div>
+                    <div class="name">${resolveString(nodeDetails.name)}</div>
+                    <div class="params">${paramDescription ? "[" + paramDescription + "]" : ""}</div>
             </div>
             <div class="results-summary-numbers-wrapper">
-                <div class="node-duration">Duration: ${nodeDetails.duration}s</div>
+                <div class="node-duration">Duration: ${nodeDetails.duration}s${formatPhaseDurations(nodeDetails.phase_durations)}${formatBaseline(nodeDetails)}</div>
                 <div class="results-summary-numbers">
                     <div class="summary-result-count passed" title="Passes">${nodeDetails.summary.passed}</div>
                     <div class="summary-result-count skipped" title="Skips">${nodeDetails.summary.skipped}</div>
@@ -220,39 +757,118 @@ function createNodeHeader(nodeDetails, odd=false) {
     `
     summary_container.odd = odd
     summary_container.querySelector("div.results-summary-container-header").addEventListener('click', toggleOpenTrigger, false);
+    registerOutcomeElement(summary_container, outcomes);
+    for (let o of Object.keys(shown_states)) {
+        registerOutcomeElement(summary_container.querySelector(`.summary-result-count.${o}`), [o]);
+    }
 
     return summary_container
 }
 
 
+function formatPhaseDurations(phaseDurations) {
+    if (phaseDurations === undefined) {
+        return "";
+    }
+    var phases = ["setup", "call", "teardown"].map(p => `${p} ${phaseDurations[p]}s`);
+    return `<span class="phase-durations">(${phases.join(", ")})</span>`;
+}
+
+
+function formatBaseline(details) {
+    // only there if the report was generated with --html-history
+    if (details.baseline === undefined || details.baseline === null) {
+        return "";
+    }
+    var classes = details.regression ? "baseline regression" : "baseline";
+    var title = details.regression ? "Significantly slower than usual" : "Mean duration in the previous runs";
+    return `<span class="${classes}" title="${title}">(usually ${details.baseline}s)</span>`;
+}
+
+
+lazyPayloads = {};
+
+function lazyPayloadLoaded(key, payload) {
+    var lazyPayload = lazyPayloads[key];
+    lazyPayload.payload = payload;
+    for (let callback of lazyPayload.callbacks) {
+        callback(payload);
+    }
+    lazyPayload.callbacks = [];
+}
+
+function loadLazyPayload(key) {
+    // payloads are loaded as scripts rather than fetched, so they can also be
+    // loaded when the report is opened from the file system
+    return new Promise(function (resolve) {
+        var lazyPayload = lazyPayloads[key];
+        if (lazyPayload === undefined) {
+            lazyPayload = {payload: null, callbacks: []};
+            lazyPayloads[key] = lazyPayload;
+            var script = document.createElement("script");
+            script.setAttribute("src", `assets/payloads/${key}.js`);
+            document.head.appendChild(script);
+        }
+        if (lazyPayload.payload !== null) {
+            resolve(lazyPayload.payload);
+        } else {
+            lazyPayload.callbacks.push(resolve);
+        }
+    });
+}
+
+function getTestPayload(testDetails) {
+    // logs are stored once, in a table of the results tree (or of the lazily
+    // loaded payload), and tests only refer to them
+    if (testDetails.remote_id !== undefined) {
+        return fetch(`${resultsApi}/tests/${testDetails.remote_id}`).then(response => response.json());
+    }
+    if (testDetails.payload === undefined) {
+        return Promise.resolve({
+            log: resultsTree.logs[testDetails.log] || "",
+            extra: testDetails.extra,
+        });
+    }
+    return loadLazyPayload(testDetails.payload).then(function (payload) {
+        var test = payload.tests[testDetails.payload_index];
+        return {log: payload.logs[test.log] || "", extra: test.extra};
+    });
+}
+
+
 function createTestDesc(testDetails) {
 
     var testDesc = document.createElement("li");
-    testDesc.setAttribute("class", `test-result ${testDetails.outcome.toLowerCase()}`);
+    var outcome = resolveString(testDetails.outcome);
+    var paramDescription = resolveString(testDetails.param_description);
+    testDesc.setAttribute("class", `test-result ${outcome.toLowerCase()}`);
+    registerOutcomeElement(testDesc, [outcome.toLowerCase()]);
     testDesc.innerHTML = `
         <div class="result-wrapper">
             <div class="test-info-wrapper">
-                <div class="outcome">${testDetails.outcome.toUpperCase()}</div>
+                <div class="outcome">${outcome.toUpperCase()}</div>
                 <div class="test-description">
-                    <div class="name">${testDetails.name}</div>
-                    <div class="params">${testDetails.param_description ? "[" + testDetails.param_description + "]" : ""}</div>
+                    <div class="name">${resolveString(testDetails.name)}</div>
+                    <div class="params">${paramDescription ? "[" + paramDescription + "]" : ""}</div>
                 </div>
                 <div class="nodeid tooltip">nodeid<span class="tooltiptext">${testDetails.nodeid}</span></div>
                 <div class="location tooltip">location<span class="tooltiptext">${testDetails.location}</span></div>
                 <button class="toggle-log"></button>
             </div>
-            <div class="duration">Duration: ${testDetails.duration}s</div>
+            <div class="duration">Duration: ${testDetails.duration}s${formatPhaseDurations(testDetails.phase_durations)}${formatBaseline(testDetails)}</div>
         </div>
-        ${testDetails.log}
     `
-    if (testDetails.extra.length) {
-        extraDiv = createExtraDiv(testDetails.extra);
-        logDiv = testDesc.querySelector(".log")
-        testDesc.insertBefore(extraDiv, logDiv);
-    }
+    getTestPayload(testDetails).then(function (payload) {
+        testDesc.insertAdjacentHTML("beforeend", payload.log);
+        if (payload.extra.length) {
+            var extraDiv = createExtraDiv(payload.extra);
+            var logDiv = testDesc.querySelector(".log");
+            testDesc.insertBefore(extraDiv, logDiv);
+        }
+    });
     testDesc.querySelector("button.toggle-log").addEventListener('click', toggleOpenClass, false);
 
-    if (!collapsed.includes(testDetails.outcome.toLowerCase())) {
+    if (!collapsed.includes(outcome.toLowerCase())) {
         testDesc.querySelector(".result-wrapper").classList.add("active")
     }
 
@@ -261,6 +877,14 @@ function createTestDesc(testDetails) {
 
 
 function expandAll() {
+    if (typeof resultsApi !== "undefined") {
+        // remote nodes are opened once their children are fetched, so only
+        // the nodes that are shown now are opened
+        for (let header of document.querySelectorAll("li.results-summary-container .results-summary-container-header:not(.active)")) {
+            toggleOpen(header);
+        }
+        return;
+    }
     while (document.querySelectorAll("li.results-summary-container .results-summary-container-header:not(.active)").length > 0) {
         toggleOpen(document.querySelector("li.results-summary-container .results-summary-container-header:not(.active)"));
     }
@@ -273,6 +897,97 @@ function collapseAll() {
 }
 
 
+maxSearchResults = 50;
+searchableNodeIds = null;
+
+function searchTests() {
+    var query = this.value.trim().toLowerCase();
+    var resultsList = document.querySelector("#search-results");
+    unregisterOutcomeElements(resultsList);
+    resultsList.innerHTML = "";
+    if (!query) {
+        return;
+    }
+    if (typeof resultsApi !== "undefined") {
+        searchRemoteTests(this, query, resultsList);
+        return;
+    }
+    if (searchableNodeIds === null) {
+        searchableNodeIds = resultsTree.search_index.nodeids.map(n => n.toLowerCase());
+    }
+    var matches = 0;
+    for (var i = 0; i < searchableNodeIds.length && matches < maxSearchResults; i++) {
+        if (searchableNodeIds[i].includes(query)) {
+            resultsList.appendChild(createSearchResult(i));
+            matches++;
+        }
+    }
+}
+
+function searchRemoteTests(input, query, resultsList) {
+    var url = `${resultsApi}/search?q=${encodeURIComponent(query)}&limit=${maxSearchResults}`;
+    fetch(url).then(response => response.json()).then(function (page) {
+        if (input.value.trim().toLowerCase() !== query) {
+            // the query changed while this one was searched for
+            return;
+        }
+        for (let test of page.items) {
+            // the tests may not have been fetched in the tree, so they are
+            // shown in the search results themselves
+            var li = document.createElement("li");
+            li.classList.add("search-result");
+            li.innerHTML = test.nodeid;
+            li.addEventListener('click', function () {
+                this.appendChild(createTestDesc(test));
+            }, {once: true});
+            resultsList.appendChild(li);
+        }
+    });
+}
+
+function createSearchResult(index) {
+    var li = document.createElement("li");
+    li.classList.add("search-result");
+    li.innerHTML = resultsTree.search_index.nodeids[index];
+    li.addEventListener('click', function () {
+        revealTest(getSearchPath(index));
+    }, false);
+    return li;
+}
+
+function getSearchPath(index) {
+    var paths = resultsTree.search_index.paths;
+    if (paths.offsets === undefined) {
+        return paths[index];
+    }
+    // the paths of prepared results are packed together
+    return paths.rows.subarray(paths.offsets[index], paths.offsets[index + 1]);
+}
+
+function revealTest(path) {
+    // only expand the nodes along the path to the test
+    var li = document.querySelector(".top-container-list").children[path[0]];
+    for (var i = 1; i < path.length; i++) {
+        var header = li.querySelector(":scope > .results-summary-container-header");
+        if (!header.classList.contains("active")) {
+            toggleOpen(header);
+        }
+        var childContainers = li.querySelector(":scope > .child-containers");
+        if (i < path.length - 1) {
+            li = childContainers.querySelector(":scope > .child-node-containers").children[path[i]];
+        } else {
+            li = childContainers.querySelector(":scope > .test-containers").children[path[i]];
+        }
+    }
+    var previousHit = document.querySelector(".test-result.search-hit");
+    if (previousHit) {
+        previousHit.classList.remove("search-hit");
+    }
+    li.classList.add("search-hit");
+    li.scrollIntoView();
+}
+
+
 function createExtraDiv(extras) {
     var imagesDiv = document.createElement("div");
     imagesDiv.classList.add("extra-image-previews-wrapper");
@@ -296,6 +1011,7 @@ function createExtraDiv(extras) {
                     othersDiv.appendChild(createExtraJson(ex));
                     break;
                 case "link":
+                case "url":
                     othersDiv.appendChild(createExtraLink(ex));
                     break;
                 case "html":
@@ -326,7 +1042,7 @@ function createExtraImagePreview(imageDetails, imageIndex) {
     previewImageWrapper = document.createElement("div");
     previewImageWrapper.classList.add("preview-image-wrapper");
     var img = document.createElement("img");
-    img.setAttribute("src", imageDetails.content);
+    img.setAttribute("src", imageDetails.thumbnail || imageDetails.content);
     img.setAttribute("alt", imageDetails.name);
     img.setAttribute("title", imageDetails.name);
     imagePreviewDiv.addEventListener('click', showSlideshow, false);
@@ -383,6 +1099,7 @@ function createExtraLink(linkDetails) {
     contentDiv.classList.add("content");
     var a = document.createElement("a");
     a.setAttribute("href", linkDetails.content);
+    a.textContent = linkDetails.name || linkDetails.content;
     contentDiv.appendChild(a);
     linkDiv.appendChild(contentDiv);
     return linkDiv;
@@ -434,8 +1151,9 @@ function showSlideshow() {
         num.classList.add("slideshow-number");
         num.innerText = `${i + 1} / ${images.length}`;
 
+        // the full image is only loaded once its slide is shown
         let slideImg = document.createElement("img");
-        slideImg.setAttribute("src", imageDetails.content);
+        slideImg.dataset.src = imageDetails.content;
         slideImg.setAttribute("alt", imageDetails.name);
         slideImg.setAttribute("title", imageDetails.name);
 
@@ -445,7 +1163,7 @@ function showSlideshow() {
 
         // create thumbnail
         let thumbImg = document.createElement("img");
-        thumbImg.setAttribute("src", imageDetails.content);
+        thumbImg.setAttribute("src", imageDetails.thumbnail || imageDetails.content);
         thumbImg.setAttribute("onclick", `switchToSlide(${i})`);
         thumbImg.setAttribute("alt", imageDetails.name);
         thumbImg.setAttribute("title", imageDetails.name);
@@ -554,6 +1272,10 @@ function switchToSlide(n) {
             slides[i].classList.remove("active");
             thumbnails[i].classList.remove("active");
         } else {
+            let slideImg = slides[i].querySelector("img");
+            if (!slideImg.hasAttribute("src")) {
+                slideImg.setAttribute("src", slideImg.dataset.src);
+            }
             slides[i].classList.add("active");
             thumbnails[i].classList.add("active");
             thumbnails[i].scrollIntoView()
@@ -0,0 +1,170 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Serve the results stored with ``--html-results-db`` over HTTP.
+
+The report is served as a page without any results in it, which fetches them
+from the API as they're shown, so even a report with hundreds of thousands of
+tests opens straight away. The API has these endpoints, which all return
+JSON, and the ones that list nodes or tests take ``offset`` and ``limit``
+parameters to page through them:
+
+``/api/nodes?parent=<id>``
+    The child nodes of a node, or the top ones without ``parent``.
+``/api/tests?parent=<id>&outcome=<outcomes>``
+    The tests of a node, or of the whole report without ``parent``, only
+    including those with one of the comma separated ``outcome`` if given.
+``/api/tests/<id>``
+    The log and extra content of a test.
+``/api/search?q=<query>``
+    The first tests with the query in their node ID.
+
+Anything under ``/assets/`` is served from the assets directory of the report.
+"""
+
+from __future__ import print_function
+
+import argparse
+import json
+import mimetypes
+import os
+import shutil
+import sys
+
+from .store import ResultsStore
+
+if sys.version_info[0] == 3:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, unquote, urlparse
+else:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+    from urlparse import parse_qs, urlparse
+
+# the most nodes or tests that are returned at once
+MAX_PAGE_SIZE = 1000
+
+
+class ResultsServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, store):
+        HTTPServer.__init__(self, address, ResultsRequestHandler)
+        self.store = store
+
+
+class ResultsRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = dict((k, v[-1]) for k, v in parse_qs(url.query).items())
+        parts = [unquote(p) for p in url.path.split("/") if p]
+        try:
+            if not parts:
+                self._send(self.server.store.meta("page"), "text/html")
+            elif parts[0] == "assets":
+                self._send_asset(parts)
+            elif parts[0] == "api" and len(parts) > 1:
+                result = self._api(parts[1:], query)
+                if result is None:
+                    self.send_error(404)
+                else:
+                    self._send(json.dumps(result), "application/json")
+            else:
+                self.send_error(404)
+        except ValueError:
+            self.send_error(400)
+
+    def _api(self, parts, query):
+        store = self.server.store
+        offset = int(query.get("offset", 0))
+        limit = min(int(query.get("limit", 100)), MAX_PAGE_SIZE)
+        parent = query.get("parent")
+        if parent is not None:
+            parent = int(parent)
+        if parts == ["nodes"]:
+            return store.nodes(parent, offset, limit)
+        if parts == ["tests"]:
+            outcomes = [
+                o.strip().lower()
+                for o in query.get("outcome", "").split(",") if o.strip()
+            ]
+            return store.tests(parent, outcomes, offset, limit)
+        if len(parts) == 2 and parts[0] == "tests":
+            return store.test(int(parts[1]))
+        if parts == ["search"]:
+            return store.search(query.get("q", ""), limit)
+        return None
+
+    def _send_asset(self, parts):
+        assets_dir = os.path.realpath(os.path.join(
+            self.server.store.meta("report_dir"),
+            "assets",
+        ))
+        path = os.path.realpath(os.path.join(assets_dir, *parts[1:]))
+        if (not path.startswith(assets_dir + os.sep) or
+                not os.path.isfile(path)):
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header(
+            "Content-Type",
+            mimetypes.guess_type(path)[0] or "application/octet-stream",
+        )
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def _send(self, content, content_type):
+        body = content.encode("utf-8")
+        self.send_response(200)
+        self.send_header(
+            "Content-Type",
+            "{0}; charset=utf-8".format(content_type),
+        )
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_request(self, code="-", size="-"):
+        # only the errors are worth showing, which are logged separately
+        pass
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        prog="pytest-html-serve",
+        description="Serve the results of a report stored with "
+        "--html-results-db, which are fetched as they're shown.",
+    )
+    parser.add_argument("database", help="path of the results database")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000,
+                        help="port to listen on (default: 8000)")
+    args = parser.parse_args(args)
+    if not os.path.isfile(args.database):
+        parser.error("no such file: {0}".format(args.database))
+
+    store = ResultsStore(args.database)
+    server = ResultsServer((args.host, args.port), store)
+    print("Serving {0} on http://{1}:{2}/".format(
+        args.database,
+        args.host,
+        server.server_address[1],
+    ))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Store the results of a report in a SQLite database, and query them.
+
+The results tree is flattened into a table of nodes, where each node refers
+to its parent, and has its position among the other child nodes (or tests) of
+that parent, so the children of a node can be fetched a page at a time. The
+logs of the tests are stored in a table of their own, as they are only needed
+once a test is shown.
+"""
+
+from collections import deque
+import json
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE nodes (
+    id INTEGER PRIMARY KEY,
+    parent INTEGER,
+    position INTEGER,
+    is_test INTEGER,
+    nodeid TEXT,
+    outcome TEXT,
+    child_count INTEGER,
+    test_count INTEGER,
+    details TEXT,
+    extra TEXT,
+    log TEXT
+);
+CREATE INDEX nodes_children ON nodes (parent, is_test, position);
+CREATE INDEX nodes_outcomes ON nodes (is_test, outcome);
+CREATE TABLE logs (
+    key TEXT PRIMARY KEY,
+    html TEXT
+);
+"""
+
+# the details of the nodes that are fetched separately, or not at all
+SEPARATE_KEYS = ("children", "test_results", "extra", "log")
+
+
+class ResultsStore(object):
+    """The results of a report, stored in a SQLite database.
+
+    The connection is shared between the threads of the server, so the
+    queries are made while holding ``_lock``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def write(cls, path, tree, page, report_dir):
+        """Write the nested results tree (with its logs) to a new database.
+
+        ``page`` is the HTML of the report, without any results in it, which
+        is served to show them, and ``report_dir`` is where the assets it
+        refers to are.
+        """
+        if os.path.exists(path):
+            os.remove(path)
+        store = cls(path)
+        with store.connection as connection:
+            connection.executescript(SCHEMA)
+            meta = {
+                "name": tree["name"],
+                "summary": tree["summary"],
+                "phase_durations": tree.get("phase_durations"),
+                "suite_info": tree["suite_info"],
+                "page": page,
+                "report_dir": os.path.abspath(report_dir),
+            }
+            connection.executemany(
+                "INSERT INTO meta VALUES (?, ?)",
+                ((k, json.dumps(v, default=str)) for k, v in meta.items()),
+            )
+            connection.executemany(
+                "INSERT INTO nodes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                flatten_nodes(tree["results"]),
+            )
+            connection.executemany(
+                "INSERT INTO logs VALUES (?, ?)",
+                tree["logs"].items(),
+            )
+        return store
+
+    def close(self):
+        self.connection.close()
+
+    def _query(self, sql, parameters=()):
+        with self._lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def meta(self, key):
+        rows = self._query("SELECT value FROM meta WHERE key = ?", (key,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def nodes(self, parent=None, offset=0, limit=100):
+        """Get a page of the child nodes of the parent (or the top ones)."""
+        where = "is_test = 0 AND parent IS ?"
+        rows = self._query(
+            "SELECT id, child_count, test_count, details, extra FROM nodes "
+            "WHERE {0} ORDER BY position LIMIT ? OFFSET ?".format(where),
+            (parent, limit, offset),
+        )
+        items = []
+        for node_id, child_count, test_count, details, extra in rows:
+            node = json.loads(details)
+            node.update(
+                remote_id=node_id,
+                child_count=child_count,
+                test_count=test_count,
+                extra=json.loads(extra),
+            )
+            items.append(node)
+        return {"items": items, "total": self._count(where, (parent,))}
+
+    def tests(self, parent=None, outcomes=None, offset=0, limit=100):
+        """Get a page of the tests of the parent, or of the whole report.
+
+        If ``outcomes`` are given, only the tests with those (lower case)
+        outcomes are included.
+        """
+        where = "is_test = 1"
+        parameters = ()
+        if parent is not None:
+            where += " AND parent = ?"
+            parameters += (parent,)
+        if outcomes:
+            where += " AND lower(outcome) IN ({0})".format(
+                ", ".join("?" * len(outcomes)),
+            )
+            parameters += tuple(outcomes)
+        rows = self._query(
+            "SELECT id, details FROM nodes WHERE {0} "
+            "ORDER BY parent, position LIMIT ? OFFSET ?".format(where),
+            parameters + (limit, offset),
+        )
+        return {
+            "items": [remote_test(i, d) for i, d in rows],
+            "total": self._count(where, parameters),
+        }
+
+    def test(self, test_id):
+        """Get the log and extra content of the test, or ``None``."""
+        rows = self._query(
+            "SELECT nodes.extra, logs.html FROM nodes "
+            "LEFT JOIN logs ON logs.key = nodes.log "
+            "WHERE nodes.id = ? AND nodes.is_test = 1",
+            (test_id,),
+        )
+        if not rows:
+            return None
+        extra, log = rows[0]
+        return {"extra": json.loads(extra), "log": log or ""}
+
+    def search(self, query, limit=50):
+        """Get the first tests that have the query in their node ID."""
+        for special in ("\\", "%", "_"):
+            query = query.replace(special, "\\" + special)
+        pattern = "%{0}%".format(query)
+        rows = self._query(
+            "SELECT id, details FROM nodes WHERE is_test = 1 "
+            "AND nodeid LIKE ? ESCAPE '\\' ORDER BY id LIMIT ?",
+            (pattern, limit),
+        )
+        return {"items": [remote_test(i, d) for i, d in rows]}
+
+    def _count(self, where, parameters):
+        return self._query(
+            "SELECT count(*) FROM nodes WHERE {0}".format(where),
+            parameters,
+        )[0][0]
+
+
+def remote_test(test_id, details):
+    test = json.loads(details)
+    test["remote_id"] = test_id
+    return test
+
+
+def flatten_nodes(results):
+    """Get a row for each node of the nested results, parents first.
+
+    The IDs of the rows are given in the order the nodes are walked in, so
+    the parent of a node always has a lower ID than the node itself.
+    """
+    next_id = 1
+    pending = deque((None, p, node) for p, node in enumerate(results))
+    while pending:
+        parent, position, node = pending.popleft()
+        node_id = next_id
+        next_id += 1
+        is_test = "children" not in node
+        details = dict(
+            (k, v) for k, v in node.items() if k not in SEPARATE_KEYS
+        )
+        children = node.get("children", [])
+        tests = node.get("test_results", [])
+        yield (
+            node_id,
+            parent,
+            position,
+            int(is_test),
+            node.get("nodeid"),
+            node.get("outcome"),
+            len(children),
+            len(tests),
+            json.dumps(details),
+            json.dumps(node.get("extra", [])),
+            node.get("log"),
+        )
+        pending.extend((node_id, p, c) for p, c in enumerate(children))
+        pending.extend((node_id, p, t) for p, t in enumerate(tests))
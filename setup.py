@@ -9,7 +9,10 @@ setup(name='pytest-html',
       url='https://github.com/pytest-dev/pytest-html',
       packages=['pytest_html'],
       package_data={'pytest_html': ['resources/*']},
-      entry_points={'pytest11': ['html = pytest_html.plugin']},
+      entry_points={
+          'pytest11': ['html = pytest_html.plugin'],
+          'console_scripts': ['pytest-html-serve = pytest_html.serve:main'],
+      },
       setup_requires=['setuptools_scm'],
       install_requires=[
         'pytest>=3.0',
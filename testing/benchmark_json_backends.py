@@ -0,0 +1,125 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""Compare how long the JSON backends take to serialize a large results tree.
+
+The tree is synthetic, but shaped like the one ``HTMLReport`` embeds in the
+report, with a number of modules, each with a number of classes of tests, and
+a log for every failing one. Run it with::
+
+    python testing/benchmark_json_backends.py --modules 50 --tests 200
+
+Backends that aren't installed are skipped.
+"""
+
+from __future__ import print_function
+
+import argparse
+import timeit
+
+from pytest_html.plugin import JSON_BACKENDS, OUTCOMES, json_dumps
+
+
+def make_test(module, cls, index):
+    outcome = "Failed" if index % 10 == 0 else "Passed"
+    nodeid = "test_module_{0}.py::TestClass{1}::test_{2}".format(
+        module, cls, index)
+    return {
+        "name": "test_{0}".format(index),
+        "duration": "{0:.2f}".format(index * 0.001),
+        "phase_durations": {"setup": "0.00", "call": "0.01",
+                            "teardown": "0.00"},
+        "params": [{
+            "name": "param",
+            "description": "'value {0}'".format(index % 5),
+            "param_index": index % 5,
+            "baseid": "test_module_{0}.py".format(module),
+        }],
+        "baseline": None,
+        "regression": False,
+        "param_description": "value {0}".format(index % 5),
+        "extra": [],
+        "log": "log-{0}".format(index) if outcome == "Failed" else None,
+        "nodeid": nodeid,
+        "location": ["test_module_{0}.py".format(module), index, nodeid],
+        "outcome": outcome,
+    }
+
+
+def make_group(name, children, tests):
+    return {
+        "name": name,
+        "duration": "1.00",
+        "phase_durations": {"setup": "0.10", "call": "0.80",
+                            "teardown": "0.10"},
+        "params": [],
+        "baseline": None,
+        "regression": False,
+        "param_description": "",
+        "extra": [],
+        "log": None,
+        "summary": dict((o, 1) for o in OUTCOMES),
+        "children": children,
+        "test_results": tests,
+    }
+
+
+def make_tree(modules, classes, tests):
+    results = []
+    logs = {}
+    for m in range(modules):
+        children = []
+        for c in range(classes):
+            test_results = [make_test(m, c, t) for t in range(tests)]
+            for test in test_results:
+                if test["log"] is not None:
+                    logs[test["log"]] = (
+                        '<div class="log">' + "E   assert False<br/>" * 20 +
+                        "</div>"
+                    )
+            children.append(make_group("TestClass{0}".format(c), [],
+                                       test_results))
+        results.append(make_group("test_module_{0}.py".format(m), children,
+                                  []))
+    return {
+        "name": "benchmark",
+        "summary": dict((o, 0) for o in OUTCOMES),
+        "results": results,
+        "logs": logs,
+        "suite_info": {"generated": "2020-01-01T00:00:00", "run_time": 1.0,
+                       "numtests": modules * classes * tests,
+                       "environment": {}},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--modules", type=int, default=20)
+    parser.add_argument("--classes", type=int, default=5)
+    parser.add_argument("--tests", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    tree = make_tree(args.modules, args.classes, args.tests)
+    print("{0} tests".format(args.modules * args.classes * args.tests))
+    for backend, available in JSON_BACKENDS.items():
+        if not available:
+            print("{0:>15}: not installed".format(backend))
+            continue
+        for indent in (False, True):
+            size = len(json_dumps(tree, backend, indent))
+            best = min(timeit.repeat(
+                lambda: json_dumps(tree, backend, indent),
+                number=1,
+                repeat=args.repeat,
+            ))
+            print("{0:>15}: {1:8.3f}s {2:>12,} chars".format(
+                backend + (" (indent)" if indent else ""),
+                best,
+                size,
+            ))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,8 +2,11 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from base64 import b64encode
+from array import array
+from base64 import b64encode, b64decode
+from distutils.spawn import find_executable
 from distutils.version import LooseVersion
+import gzip
 import json
 import os
 import sys
@@ -11,12 +14,21 @@ import pkg_resources
 import random
 import re
 import hashlib
+import subprocess
+import threading
+import zlib
 
 import pytest
 
 PY3 = sys.version_info[0] == 3
 pytest_plugins = "pytester",
 
+if PY3:
+    from urllib.error import HTTPError
+    from urllib.request import urlopen
+else:
+    from urllib2 import HTTPError, urlopen
+
 
 def run(testdir, path='report.html', *args):
     path = testdir.tmpdir.join(path)
@@ -26,6 +38,16 @@ def run(testdir, path='report.html', *args):
     return result, html
 
 
+def read_payload(html):
+    # the results tree embedded in a report (or its script), compressed or not
+    blob = re.search("resultsTreeCompressed = '([^']+)'", html)
+    if blob is None:
+        tree = html.split('\nresultsTree = ')[1]
+        return json.JSONDecoder().raw_decode(tree)[0]
+    payload = zlib.decompress(b64decode(blob.group(1)))
+    return json.loads(payload.decode('utf-8'))
+
+
 def assert_results_by_outcome(html, test_outcome, test_outcome_number,
                               label=None):
     # Asserts if the test number of this outcome in the summary is correct
@@ -217,6 +239,1073 @@ class TestHTML:
         regex_css_link = '<link href="assets/style.css" rel="stylesheet"'
         assert re.search(regex_css_link, html) is not None
 
+    def test_compress_gzip(self, testdir):
+        testdir.makepyfile('def test_pass(): pass')
+        path = testdir.tmpdir.join('report.html')
+        result = testdir.runpytest('--html', path, '--html-compress', 'gzip')
+        assert result.ret == 0
+        assert not path.check()
+        with gzip.open(str(path) + '.gz', 'rb') as f:
+            html = f.read().decode('utf-8')
+        assert 'assets/script.js' in html
+        assets_dir = testdir.tmpdir.join('assets')
+        assert assets_dir.join('style.css.gz').check()
+        assert assets_dir.join('script.js.gz').check()
+        assert not assets_dir.join('style.css').check()
+
+    def test_compress_gzip_lazy_payload(self, testdir):
+        testdir.makepyfile("""
+            def test_fail():
+                print('full output' * 10)
+                assert False
+        """)
+        path = testdir.tmpdir.join('report.html')
+        result = testdir.runpytest('--html', path, '--html-compress', 'gzip',
+                                   '--html-lazy-payload',
+                                   '--html-log-section-limit', '10')
+        assert result.ret == 1
+        assets_dir = testdir.tmpdir.join('assets')
+        assert assets_dir.join('script.js.gz').check()
+        # the files the report fetches, or links to, are written as they are
+        payload, = assets_dir.join('payloads').listdir()
+        assert payload.ext == '.js'
+        assert payload.read().startswith('lazyPayloadLoaded(')
+        logs = assets_dir.join('logs').listdir()
+        assert logs
+        for log in logs:
+            assert log.ext == '.txt'
+            assert log.basename in payload.read()
+        assert any('full output' in log.read() for log in logs)
+
+    def test_compress_payload(self, testdir):
+        testdir.makepyfile('def test_pass(): pass')
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-compress-payload')
+        assert result.ret == 0
+        assert 'resultsTree = {' not in html
+        payload = read_payload(html)
+        assert payload['summary']['passed'] == 1
+
+    @pytest.mark.parametrize('payload_format',
+                             ['nested', 'interned', 'columnar'])
+    def test_compress_payload_worker(self, testdir, payload_format):
+        node = find_executable('node')
+        if node is None:
+            pytest.skip('node is needed to run the script of the report')
+        # runs the script of the report, with workers that only get the
+        # source of their functions, in strict mode, so using anything else
+        # of the page fails
+        testdir.makefile('.js', harness="""
+            const fs = require('fs');
+            const vm = require('vm');
+            if (typeof DecompressionStream === 'undefined' ||
+                    typeof structuredClone === 'undefined') {
+                process.exit(77);
+            }
+            const globals = () => ({
+                atob: s => Buffer.from(s, 'base64').toString('binary'),
+                Blob: Blob,
+                Response: Response,
+                DecompressionStream: DecompressionStream,
+                TextEncoder: TextEncoder,
+                TextDecoder: TextDecoder,
+            });
+            const sources = {};
+            const posted = [];
+            class Worker {
+                constructor(url) {
+                    this.source = sources[url];
+                }
+                postMessage(data) {
+                    const post = (result, transfer) => setImmediate(() => {
+                        posted.push({
+                            keys: Object.keys(result),
+                            moved: (transfer || []).length,
+                        });
+                        this.onmessage({data: structuredClone(
+                            result, {transfer: transfer})});
+                    });
+                    this.source.then(source => {
+                        const worker = vm.createContext(
+                            Object.assign(globals(), {postMessage: post}));
+                        vm.runInContext('"use strict";\\n' + source, worker);
+                        worker.onmessage({data: structuredClone(data)});
+                    });
+                }
+                terminate() {}
+            }
+            const page = vm.createContext(Object.assign(globals(), {
+                Worker: Worker,
+                URL: {
+                    createObjectURL: blob => {
+                        const url = 'blob:' + Object.keys(sources).length;
+                        sources[url] = blob.text();
+                        return url;
+                    },
+                    revokeObjectURL: () => {},
+                },
+                window: {location: {search: ''}},
+                document: {},
+                done: (tree, payload) => console.log(JSON.stringify({
+                    posted: posted,
+                    names: tree.results.map(n => n.name),
+                    outcomes: tree.results.map(n => n.outcomes),
+                    tests: tree.results[0].test_results.map(
+                        t => [t.name, t.outcome]),
+                    log: payload.log,
+                    nodeids: tree.search_index.nodeids,
+                    path: Array.from(page.getSearchPath(1)),
+                })),
+            }));
+            vm.runInContext(fs.readFileSync(process.argv[2], 'utf8'), page);
+            vm.runInContext(`loadResultsTree().then(tree => {
+                const test = tree.results[0].test_results[1];
+                return getTestPayload(test).then(p => done(tree, p));
+            })`, page);
+        """)
+        testdir.makepyfile("""
+            def test_Pass(): pass
+            def test_fail(): assert False, 'the failure'
+        """)
+        result, html = run(testdir, 'report.html', '--html-compress-payload',
+                           '--html-payload-format', payload_format)
+        assert result.ret == 1
+        script = testdir.tmpdir.join('assets', 'script.js')
+        process = subprocess.Popen(
+            [node, 'harness.js', str(script)],
+            cwd=str(testdir.tmpdir),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        out, err = process.communicate()
+        if process.returncode == 77:
+            pytest.skip('node is too old to run the script of the report')
+        assert process.returncode == 0, err
+        loaded = json.loads(out.decode('utf-8'))
+        # the worker posts the results laid out in columns, with their
+        # buffers moved, rather than the tree
+        posted, = loaded['posted']
+        assert 'results' not in posted['keys']
+        assert posted['moved'] > 0
+        assert loaded['names'] == ['test_compress_payload_worker.py']
+        assert loaded['outcomes'] == [['passed', 'failed']]
+        assert loaded['tests'] == [
+            ['test_Pass', 'Passed'],
+            ['test_fail', 'Failed'],
+        ]
+        assert 'the failure' in loaded['log']
+        assert loaded['nodeids'] == [
+            'test_compress_payload_worker.py::test_Pass',
+            'test_compress_payload_worker.py::test_fail',
+        ]
+        assert loaded['path'] == [0, 1]
+
+    def test_lazy_payload(self, testdir):
+        content = str(random.random())
+        testdir.makepyfile("""
+            def test_stdout():
+                print('{0}')
+        """.format(content))
+        result, html = run(testdir, 'report.html', '--html-lazy-payload')
+        assert result.ret == 0
+        assets_dir = testdir.tmpdir.join('assets')
+        assert content not in assets_dir.join('script.js').read()
+        payloads = assets_dir.join('payloads').listdir()
+        assert len(payloads) == 1
+        assert content in payloads[0].read()
+
+    def test_search_index(self, testdir):
+        testdir.makepyfile("""
+            def test_a(): pass
+            class TestB:
+                def test_c(self): pass
+        """)
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-compress-payload')
+        assert result.ret == 0
+        payload = read_payload(html)
+        index = payload['search_index']
+        for nodeid, path in zip(index['nodeids'], index['paths']):
+            node = {'children': payload['results']}
+            for i in path[:-1]:
+                node = node['children'][i]
+            assert node['test_results'][path[-1]]['nodeid'] == nodeid
+        assert sorted(index['nodeids']) == [
+            'test_search_index.py::TestB::test_c',
+            'test_search_index.py::test_a',
+        ]
+
+    def test_identical_logs_stored_once(self, testdir):
+        testdir.makepyfile("""
+            import pytest
+            @pytest.mark.parametrize('i', range(3))
+            def test_fail(i):
+                print('same output')
+                raise Exception('same failure')
+        """)
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-compress-payload', '--tb=line')
+        assert result.ret
+        payload = read_payload(html)
+        tests = payload['results'][0]['test_results']
+        assert len(tests) == 3
+        assert len(set(t['log'] for t in tests)) == 1
+        assert len(payload['logs']) == 1
+        assert 'same failure' in payload['logs'][tests[0]['log']]
+
+    @pytest.mark.parametrize('args', [[], ['-n', '1']])
+    def test_phase_durations(self, testdir, args):
+        testdir.makepyfile("""
+            import time
+            import pytest
+            @pytest.fixture
+            def slow():
+                time.sleep(0.2)
+                yield
+                time.sleep(0.1)
+            def test_slow(slow):
+                time.sleep(0.05)
+            def test_fast():
+                pass
+        """)
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-compress-payload', *args)
+        assert result.ret == 0
+        assert 'Setting up the tests took 0.2' in html
+        payload = read_payload(html)
+        module = payload['results'][0]
+        if args:
+            module = module['children'][0]
+        slow, fast = module['test_results']
+        assert float(slow['phase_durations']['setup']) >= 0.2
+        assert float(slow['phase_durations']['call']) >= 0.05
+        assert float(slow['phase_durations']['teardown']) >= 0.1
+        assert float(fast['phase_durations']['setup']) < 0.1
+        # the total is rounded from the raw durations, not the rounded ones
+        setup_total = sum(
+            float(t['phase_durations']['setup']) for t in (slow, fast))
+        module_setup = float(module['phase_durations']['setup'])
+        assert round(abs(module_setup - setup_total), 2) <= 0.01
+        assert payload['phase_durations']['teardown'] >= 0.1
+
+    @pytest.mark.parametrize('args', [[], ['-n', '1']])
+    def test_fixture_durations(self, testdir, args):
+        testdir.makepyfile("""
+            import time
+            import pytest
+            @pytest.fixture(scope='module', params=['a', 'b'])
+            def slow(request):
+                time.sleep(0.1)
+                yield request.param
+                time.sleep(0.05)
+            @pytest.fixture
+            def fast():
+                pass
+            @pytest.fixture(params=[1], ids=['one'])
+            def named(request):
+                pass
+            def test_one(slow, fast):
+                pass
+            def test_two(slow, fast, named):
+                pass
+        """)
+        result, html = run(testdir, 'report.html', *args)
+        assert result.ret == 0
+        table = re.search('<table id="fixture-durations">(.*?)</table>',
+                          html, re.S).group(1)
+        rows = [
+            re.findall('<td>([^<]*)</td>', row)
+            for row in re.findall('<tr>(.*?)</tr>', table, re.S)[1:]
+        ]
+        # the parameters are shown the same way as in the results tree
+        assert sorted(row[:5] for row in rows[:2]) == [
+            ['slow', '&apos;a&apos;', 'module', 'test_fixture_durations.py',
+             '1'],
+            ['slow', '&apos;b&apos;', 'module', 'test_fixture_durations.py',
+             '1'],
+        ]
+        assert sorted(row[:5] for row in rows[2:]) == [
+            ['fast', '', 'function', 'test_fixture_durations.py', '4'],
+            ['named', '&apos;one&apos;', 'function',
+             'test_fixture_durations.py', '2'],
+        ]
+        for row in rows[:2]:
+            assert float(row[5]) >= 0.1
+            assert float(row[6]) >= 0.05
+
+    @pytest.mark.parametrize('args, workers', [
+        ([], ['master']),
+        (['-n', '2'], ['gw0', 'gw1']),
+    ])
+    def test_worker_timeline(self, testdir, args, workers):
+        testdir.makepyfile("""
+            import time
+            import pytest
+            @pytest.mark.parametrize('i', range(6))
+            def test_sleep(i):
+                time.sleep(0.3 if i == 5 else 0.01)
+        """)
+        result, html = run(testdir, 'report.html', *args)
+        assert result.ret == 0
+        table = re.search('<table id="worker-utilization">(.*?)</table>',
+                          html, re.S).group(1)
+        rows = [
+            re.findall('<td>([^<]*)</td>', row)
+            for row in re.findall('<tr>(.*?)</tr>', table, re.S)[1:]
+        ]
+        assert [row[0] for row in rows] == workers
+        assert sum(int(row[1]) for row in rows) == 6
+        assert max(float(row[2]) for row in rows) >= 0.3
+        if len(workers) > 1:
+            # one worker sits idle while the other runs the slow test
+            assert max(float(row[4]) for row in rows) >= 0.2
+        lanes = html.count('class="worker-timeline-lane"')
+        assert lanes == len(workers)
+
+    def test_slowest_tests(self, testdir):
+        testdir.makepyfile("""
+            import time
+            import pytest
+            class TestSleep:
+                @pytest.mark.parametrize('i', range(12))
+                def test_sleep(self, i):
+                    time.sleep(0.01 * i)
+            def test_fast():
+                pass
+        """)
+        result, html = run(testdir)
+        assert result.ret == 0
+
+        def table_rows(table_id):
+            table = re.search('<table id="{0}">(.*?)</table>'.format(table_id),
+                              html, re.S).group(1)
+            return [
+                re.findall('<td>([^<]*)</td>', row)
+                for row in re.findall('<tr>(.*?)</tr>', table, re.S)[1:]
+            ]
+
+        tests = table_rows('slowest-tests')
+        assert [t[0] for t in tests] == [
+            'test_slowest_tests.py::TestSleep::test_sleep[{0}]'.format(i)
+            for i in range(11, 1, -1)
+        ]
+        groups = table_rows('slowest-groups')
+        assert [g[:2] for g in groups] == [
+            ['test_slowest_tests.py', '13'],
+            ['test_slowest_tests.py::TestSleep', '12'],
+        ]
+        assert groups[1][3] == '&lt;= 0.1s'
+        assert groups[1][5] == '&lt;= 0.25s'
+
+    def test_history(self, testdir, monkeypatch):
+        testdir.makepyfile("""
+            import os
+            import time
+            def test_slow():
+                time.sleep(float(os.environ['SLEEP']))
+            def test_fast():
+                pass
+        """)
+        monkeypatch.setenv('SLEEP', '0.01')
+        for _ in range(3):
+            result, html = run(testdir, 'report.html', '--html-history')
+            assert result.ret == 0
+        assert 'Slower than usual' in html
+        assert '<table id="regressions">' in html
+        assert 'test_history.py::test_slow' not in html.split(
+            '<table id="regressions">')[1].split('</table>')[0]
+
+        monkeypatch.setenv('SLEEP', '0.2')
+        result, html = run(testdir, 'report.html', '--html-history',
+                           '--self-contained-html', '--html-compress-payload')
+        table = html.split('<table id="regressions">')[1].split('</table>')[0]
+        assert 'test_history.py::test_slow' in table
+        assert 'test_history.py::test_fast' not in table
+        payload = read_payload(html)
+        module = payload['results'][0]
+        slow, fast = module['test_results']
+        assert 0.01 <= float(slow['baseline']) < 0.2
+        assert slow['regression'] is True
+        assert fast['regression'] is False
+        assert module['regression'] is True
+
+        history = testdir.tmpdir.join(
+            '.pytest_cache', 'v', 'pytest_html', 'history')
+        tests = json.loads(history.read())['tests']
+        assert len(tests['test_history.py::test_slow']) == 4
+
+        # tests that didn't run in any of the kept runs are dropped
+        testdir.makepyfile(test_history='def test_other(): pass')
+        for _ in range(2):
+            run(testdir, 'report.html', '--html-history',
+                '--html-history-runs', '2')
+        tests = json.loads(history.read())['tests']
+        assert list(tests) == ['test_history.py::test_other']
+
+    @pytest.mark.parametrize('runs', ['0', '-1'])
+    def test_history_runs_invalid(self, testdir, runs):
+        testdir.makepyfile('def test_pass(): pass')
+        result = testdir.runpytest('--html', 'report.html', '--html-history',
+                                   '--html-history-runs', runs)
+        assert result.ret
+        result.stderr.fnmatch_lines([
+            '*--html-history-runs must be at least 1*',
+        ])
+
+    def test_log_cache(self, testdir):
+        testdir.makepyfile("""
+            def test_fail():
+                assert False, 'cached failure'
+        """)
+        args = ['report.html', '--self-contained-html', '--html-log-cache']
+        run(testdir, *args)
+        cache_dir = testdir.tmpdir.join('.pytest_cache', 'd',
+                                        'pytest_html_logs')
+        fragment, = cache_dir.listdir()
+        assert 'cached failure' in fragment.read()
+
+        # the cached fragment is used, rather than rendering the log again
+        fragment.write(fragment.read().replace('cached failure', 'reused'))
+        result, html = run(testdir, *args)
+        assert 'reused' in html
+        assert 'cached failure' not in html
+
+        # a different limit renders the log differently, so it isn't reused
+        result, html = run(testdir, *args + ['--html-log-limit', '1000'])
+        assert 'cached failure' in html
+        assert len(cache_dir.listdir()) == 2
+
+        run(testdir, *args + ['--html-log-cache-size', '0'])
+        assert cache_dir.listdir() == []
+
+        # the shortened log of a self-contained report has no link to the full
+        # output, which the report of a run that isn't needs
+        limit = ['--html-log-section-limit', '10']
+        run(testdir, *args + limit)
+        run(testdir, 'report.html', '--html-log-cache', *limit)
+        assert len(testdir.tmpdir.join('assets', 'logs').listdir()) == 1
+        script = testdir.tmpdir.join('assets', 'script.js').read()
+        assert 'full output' in script
+
+    def test_log_cache_shared(self, tmpdir, monkeypatch):
+        from pytest_html.plugin import LogFragmentCache
+        cache = LogFragmentCache(str(tmpdir), 0)
+        cache.set('a', 'first')
+        cache.set('b', 'second')
+        # being written by another run
+        tmpdir.join('c.html.1.tmp').write('third')
+
+        remove = os.remove
+
+        def remove_by_other_run(path):
+            # another run removes the fragment first
+            remove(path)
+            raise OSError(path)
+
+        monkeypatch.setattr(os, 'remove', remove_by_other_run)
+        cache.evict()
+        assert [p.basename for p in tmpdir.listdir()] == ['c.html.1.tmp']
+
+    @pytest.mark.parametrize('backend', ['json', 'orjson', 'ujson'])
+    def test_json_backend(self, testdir, backend):
+        if backend != 'json':
+            pytest.importorskip(backend)
+        testdir.makepyfile("""
+            import pytest
+            @pytest.fixture(params=[b'bytes', 1j, {'a': 1}, 'text'],
+                            autouse=True)
+            def param(request):
+                return request.param
+            def test_pass(): pass
+        """)
+        payloads = []
+        for args in [['--html-json-backend', backend],
+                     ['--html-json-backend', backend,
+                      '--html-compress-payload']]:
+            result, html = run(testdir, 'report.html', '--self-contained-html',
+                               *args)
+            assert result.ret == 0
+            payloads.append(read_payload(html))
+
+        def without_timings(nodes):
+            # the durations of the two runs may differ
+            return [dict(
+                (k, without_timings(v) if k in ('children', 'test_results')
+                 else v)
+                for k, v in node.items()
+                if k not in ('duration', 'phase_durations')
+            ) for node in nodes]
+
+        assert (without_timings(payloads[0]['results']) ==
+                without_timings(payloads[1]['results']))
+        tests = payloads[0]['results'][0]['test_results']
+        assert [t['params'][0]['description'] for t in tests] == [
+            repr(b'bytes'), '1j', "{'a': 1}", "'text'",
+        ]
+
+    @pytest.mark.parametrize('args', [[], ['-n', '1']])
+    def test_node_extra_not_duplicated(self, testdir, args):
+        testdir.makeconftest("""
+            def pytest_html_add_node_chain_extra(item, node_chain):
+                from pytest_html import extras
+                for node in node_chain:
+                    if node.name.endswith('.py'):
+                        node.extra.append(extras.url('http://example.com/'))
+        """)
+        testdir.makepyfile("""
+            def test_a(): pass
+            def test_b(): pass
+            def test_c(): pass
+        """)
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-compress-payload',
+                           '--no-group-on-worker', *args)
+        assert result.ret == 0
+        payload = read_payload(html)
+        module = payload['results'][0]
+        assert len(module['test_results']) == 3
+        assert len(module['extra']) == 1
+
+    @pytest.mark.parametrize('args', [[], ['-n', '1']])
+    def test_collect_node_extras(self, testdir, args):
+        testdir.makeconftest("""
+            def pytest_html_collect_node_extras(node, tests):
+                from pytest_html import extras
+                description = '{0} {1}'.format(
+                    node.name,
+                    ','.join(t.name + ':' + t.outcome for t in tests),
+                )
+                node.extra.append(extras.text(description))
+        """)
+        testdir.makepyfile("""
+            import pytest
+            @pytest.fixture(scope='class', params=[1, 2], autouse=True)
+            def param(request):
+                return request.param
+            class TestA:
+                def test_a(self): pass
+                def test_b(self): assert False
+            def test_c(): pass
+        """)
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-compress-payload',
+                           '--no-group-on-worker', *args)
+        assert result.ret == 1
+        payload = read_payload(html)
+
+        def descriptions(nodes):
+            for node in nodes:
+                for e in node['extra']:
+                    yield e['content']
+                for d in descriptions(node['children']):
+                    yield d
+
+        module = 'test_collect_node_extras.py'
+        assert sorted(descriptions(payload['results'])) == sorted([
+            'TestA test_a:Passed,test_b:Failed',
+            'TestA test_a:Passed,test_b:Failed',
+            module + ' test_a:Passed,test_b:Failed,'
+            'test_a:Passed,test_b:Failed',
+            module + ' test_c:Passed',
+            module + ' test_c:Passed',
+        ])
+
+    @pytest.mark.parametrize('args, resolved', [
+        ([], ['test_fail']),
+        (['--html-deferred-extras', 'all'], ['test_fail', 'test_pass']),
+        (['-n', '1'], ['test_fail']),
+    ])
+    def test_deferred_extras(self, testdir, args, resolved):
+        testdir.makeconftest("""
+            from pytest_html import extras
+            def pytest_html_add_node_chain_extra(item, node_chain):
+                test = node_chain[-1]
+                def screenshot():
+                    return 'screenshot of ' + test.name
+                log = item.name + '.log'
+                test.extra.append(extras.text(screenshot, name='Screenshot'))
+                test.extra.append(extras.text(extras.deferred(log)))
+                test.extra.append(extras.json(extras.deferred('missing')))
+            def pytest_runtest_teardown(item):
+                with open(item.name + '.log', 'w') as f:
+                    f.write('log of ' + item.name)
+        """)
+        testdir.makepyfile("""
+            def test_pass(): pass
+            def test_fail(): assert False
+        """)
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-compress-payload', *args)
+        assert result.ret == 1
+        payload = read_payload(html)
+        tests = payload['results'][0]['test_results']
+        if args[:1] == ['-n']:
+            tests = payload['results'][0]['children'][0]['test_results']
+        extra = dict((t['name'], [e['content'] for e in t['extra']])
+                     for t in tests)
+        assert extra == dict(
+            (name, ['screenshot of ' + name, 'log of ' + name]
+             if name in resolved else [])
+            for name in ('test_pass', 'test_fail')
+        )
+
+    def test_deferred_extras_of_shared_node(self, testdir):
+        testdir.makeconftest("""
+            from pytest_html import extras
+            def pytest_html_add_node_chain_extra(item, node_chain):
+                def screenshot():
+                    return 'screenshot of ' + item.name
+                node_chain[-2].extra.append(
+                    extras.text(screenshot, name='Screenshot'))
+                node_chain[-2].extra.append(extras.text('always'))
+        """)
+        testdir.makepyfile("""
+            class TestClass:
+                def test_pass(self): pass
+                def test_fail(self): assert False
+        """)
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-compress-payload')
+        assert result.ret == 1
+        node = read_payload(html)['results'][0]['children'][0]
+        assert node['name'] == 'TestClass'
+        assert [e['content'] for e in node['extra']] == [
+            'always', 'screenshot of test_pass', 'screenshot of test_fail']
+
+    @pytest.mark.parametrize('args', [[], ['--self-contained-html']])
+    def test_file_extras(self, testdir, args):
+        testdir.makeconftest("""
+            from pytest_html import extras
+            def pytest_html_add_node_chain_extra(node_chain):
+                test = node_chain[-1]
+                test.extra.append(extras.file('video.webm', name='Video'))
+                test.extra.append(extras.file('screen.png'))
+                test.extra.append(extras.file('missing.txt'))
+        """)
+        testdir.makepyfile('def test_pass(): pass')
+        testdir.tmpdir.join('video.webm').write_binary(b'video' * 1000)
+        testdir.tmpdir.join('screen.png').write_binary(b'\x89PNG')
+        result, html = run(testdir, 'report.html', '--html-compress-payload',
+                           *args)
+        assert result.ret == 0
+        if not args:
+            html = testdir.tmpdir.join('assets', 'script.js').read()
+        payload = read_payload(html)
+        extra = payload['results'][0]['test_results'][0]['extra']
+        assert [(e['format'], e['name']) for e in extra] == [
+            ('url', 'Video'), ('image', 'File'),
+        ]
+        for e, name in zip(extra, ['video.webm', 'screen.png']):
+            original = testdir.tmpdir.join(name)
+            if args:
+                header, data = e['content'].split(',', 1)
+                assert header.endswith(';base64')
+                assert b64decode(data) == original.read_binary()
+            else:
+                assert e['content'].startswith('assets/files/')
+                assert e['content'].endswith(name[name.index('.'):])
+                asset = testdir.tmpdir.join(e['content'])
+                assert asset.read_binary() == original.read_binary()
+
+    @pytest.mark.parametrize('processes', ['0', '1', '2'])
+    def test_thumbnails(self, testdir, processes):
+        Image = pytest.importorskip('PIL.Image')
+        for i in range(8):
+            Image.new('RGB', (800 + i, 600)).save(
+                str(testdir.tmpdir.join('screen{0}.png'.format(i))),
+            )
+        testdir.makeconftest("""
+            from pytest_html import extras
+            def pytest_html_add_node_chain_extra(node_chain):
+                test = node_chain[-1]
+                for i in range(8):
+                    test.extra.append(extras.file('screen%d.png' % i))
+                test.extra.append(extras.image('http://example.com/a.png'))
+        """)
+        testdir.makepyfile('def test_pass(): pass')
+        args = ['--html', 'report.html', '--html-compress-payload',
+                '--html-thumbnail-processes', processes]
+        if processes != '2':
+            result = testdir.runpytest(*args)
+        else:
+            # the pool can't pickle the classes of the modules that are
+            # imported again for each run of runpytest in this process
+            result = testdir.runpytest_subprocess(*args)
+        assert result.ret == 0
+        script = testdir.tmpdir.join('assets', 'script.js')
+        payload = read_payload(script.read())
+        extra = payload['results'][0]['test_results'][0]['extra']
+        assert 'thumbnail' not in extra[-1]
+        for e in extra[:-1]:
+            assert e['thumbnail'].startswith('assets/thumbnails/')
+            thumbnail = testdir.tmpdir.join(e['thumbnail'])
+            width, height = Image.open(str(thumbnail)).size
+            assert width == 200 and height <= 150
+
+    def test_thumbnails_in_assets(self, testdir):
+        Image = pytest.importorskip('PIL.Image')
+        Image.new('RGB', (800, 600)).save(str(testdir.tmpdir.join('a.png')))
+        testdir.makeconftest("""
+            from pytest_html import extras
+            def pytest_html_add_node_chain_extra(node_chain):
+                node_chain[-1].extra.append(extras.file('a.png'))
+        """)
+        testdir.makepyfile('def test_pass(): pass')
+        result, html = run(testdir, 'report.html', '--html-compress-payload',
+                           '--html-thumbnail-size', '50')
+        assert result.ret == 0
+        thumbnails = testdir.tmpdir.join('assets', 'thumbnails').listdir()
+        assert len(thumbnails) == 1
+        assert Image.open(str(thumbnails[0])).size == (50, 38)
+
+        # self-contained reports embed the full images, without thumbnails
+        result, html = run(testdir, 'other.html', '--html-compress-payload',
+                           '--self-contained-html')
+        assert result.ret == 0
+        extra = read_payload(html)['results'][0]['test_results'][0]['extra']
+        assert extra[0]['content'].startswith('data:image/png;base64,')
+        assert 'thumbnail' not in extra[0]
+
+    def test_results_db(self, testdir, capsys):
+        from pytest_html.serve import ResultsServer
+        from pytest_html.store import ResultsStore
+        testdir.makepyfile("""
+            import pytest
+            @pytest.mark.parametrize('i', range(5))
+            def test_pass(i): pass
+            def test_fail(): assert False
+        """)
+        db = testdir.tmpdir.join('results.db')
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-results-db', str(db))
+        assert result.ret == 1
+        store = ResultsStore(str(db))
+        assert store.meta('summary')['passed'] == 5
+        modules = store.nodes()
+        assert modules['total'] == 1
+        module = modules['items'][0]
+        assert module['name'] == 'test_results_db.py'
+        assert module['test_count'] == 6
+        page = store.tests(module['remote_id'], offset=2, limit=3)
+        assert page['total'] == 6
+        assert [t['name'] for t in page['items']] == ['test_pass'] * 3
+        assert [t['param_description'] for t in page['items']] == [
+            '2', '3', '4',
+        ]
+        failed = store.tests(outcomes=['failed'])['items']
+        assert [t['name'] for t in failed] == ['test_fail']
+        assert 'assert False' in store.test(failed[0]['remote_id'])['log']
+        assert len(store.search('pass[3')['items']) == 1
+        assert store.search('pass_')['items'] == []
+
+        testdir.tmpdir.join('assets', 'a.txt').write('asset', ensure=True)
+        capsys.readouterr()
+        server = ResultsServer(('127.0.0.1', 0), store)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:{0}/'.format(server.server_address[1])
+            page = urlopen(url).read().decode('utf-8')
+            assert "resultsApi = 'api'" in page
+            assert 'resultsTree =' not in page.split("projectName = ")[1]
+            tests = json.loads(urlopen(
+                url + 'api/tests?outcome=failed,error').read().decode('utf-8'))
+            assert tests['total'] == 1
+            passed = json.loads(urlopen(
+                url + 'api/tests?parent={0}&outcome=passed&limit=2'.format(
+                    module['remote_id'],
+                )).read().decode('utf-8'))
+            assert passed['total'] == 5
+            assert len(passed['items']) == 2
+            test = json.loads(urlopen(url + 'api/tests/{0}'.format(
+                tests['items'][0]['remote_id'])).read().decode('utf-8'))
+            assert 'assert False' in test['log']
+            assert urlopen(url + 'assets/a.txt').read() == b'asset'
+            for path in ['api/tests/1000', 'assets/../results.db']:
+                with pytest.raises(HTTPError) as excinfo:
+                    urlopen(url + path)
+                assert excinfo.value.code == 404
+        finally:
+            server.shutdown()
+            server.server_close()
+            store.close()
+        # only the errors are logged
+        log = capsys.readouterr().err
+        assert log.count('code 404, message Not Found') == 2
+        assert 'a.txt' not in log
+
+    def test_deferred_extras_errors(self, testdir):
+        testdir.makeconftest("""
+            from pytest_html import extras
+            def pytest_html_add_node_chain_extra(node_chain):
+                def screenshot():
+                    raise RuntimeError('the browser is gone')
+                test = node_chain[-1]
+                test.extra.append(extras.image(screenshot, name='Screen'))
+                test.extra.append(extras.json(extras.deferred('data.json')))
+        """)
+        testdir.makepyfile('def test_fail(): assert False')
+        # the test didn't get as far as finishing it
+        testdir.tmpdir.join('data.json').write('{"truncated": ')
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-compress-payload')
+        assert result.ret == 1
+        payload = read_payload(html)
+        extra = payload['results'][0]['test_results'][0]['extra']
+        assert [(e['name'], e['format']) for e in extra] == [
+            ('Screen', 'text'), ('JSON', 'text'),
+        ]
+        assert 'RuntimeError: the browser is gone' in extra[0]['content']
+        assert extra[1]['content'] == '{"truncated": '
+
+    def test_deferred_extras_unknown_outcome(self, testdir):
+        testdir.makepyfile('def test_pass(): pass')
+        result = testdir.runpytest('--html', 'report.html',
+                                   '--html-deferred-extras', 'failed,broken')
+        result.stderr.fnmatch_lines(['*unknown outcomes: broken*'])
+
+    def test_interned_payload(self, testdir):
+        testdir.makepyfile("""
+            def test_a(): pass
+            def test_b(): pass
+        """)
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-compress-payload',
+                           '--html-payload-format', 'interned')
+        assert result.ret == 0
+        payload = read_payload(html)
+        assert payload['format'] == 'interned'
+        strings = payload['strings']
+        module = payload['results'][0]
+        assert strings[module['name']] == 'test_interned_payload.py'
+        tests = module['test_results']
+        assert [strings[t['name']] for t in tests] == ['test_a', 'test_b']
+        assert tests[0]['outcome'] == tests[1]['outcome']
+        assert strings[tests[0]['outcome']] == 'Passed'
+
+    def test_columnar_payload(self, testdir):
+        testdir.makepyfile("""
+            def test_pass(): pass
+            def test_fail(): assert False
+        """)
+
+        def decode_columns(payload):
+            columns = {}
+            for name, packed in payload['columns'].items():
+                column = array(payload['column_types'][name])
+                if PY3:
+                    column.frombytes(b64decode(packed))
+                else:
+                    column.fromstring(b64decode(packed))
+                columns[name] = column
+            return columns
+
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-compress-payload',
+                           '--html-payload-format', 'columnar')
+        assert result.ret
+        payload = read_payload(html)
+        assert payload['format'] == 'columnar'
+        assert [c for c, t in payload['column_types'].items() if t == 'd'] == [
+            'duration', 'phase_durations', 'baseline_duration']
+        columns = decode_columns(payload)
+        strings = payload['strings']
+        module_row = columns['parent'].index(-1)
+        assert strings[columns['name'][module_row]] == (
+            'test_columnar_payload.py')
+        tests = dict(
+            (strings[columns['name'][row]], strings[columns['outcome'][row]])
+            for row, parent in enumerate(columns['parent'])
+            if parent == module_row
+        )
+        assert tests == {'test_pass': 'Passed', 'test_fail': 'Failed'}
+        summary_start = module_row * len(payload['outcomes'])
+        summary = columns['summary'][
+            summary_start:summary_start + len(payload['outcomes'])]
+        assert dict(zip(payload['outcomes'], summary))['failed'] == 1
+        phases = len(payload['phases'])
+        for row, parent in enumerate(columns['parent']):
+            if parent == module_row:
+                durations = columns['phase_durations'][
+                    row * phases:(row + 1) * phases]
+                assert all(d >= 0 for d in durations)
+                assert abs(sum(durations) - columns['duration'][row]) < 0.01
+        assert not any(columns['is_xdist_slave'])
+
+        # the nodes of the workers of pytest-xdist are marked as such, as in
+        # the nested format
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-payload-format', 'columnar', '-n', '1')
+        columns = decode_columns(read_payload(html))
+        assert list(columns['is_xdist_slave']) == [1, 0, 0, 0]
+
+    def test_render_thread(self, testdir):
+        testdir.makepyfile("""
+            import pytest
+            @pytest.mark.parametrize('i', range(20))
+            def test_fail(i):
+                assert i % 2, 'failure {0}'.format(i)
+        """)
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-compress-payload', '--html-render-thread')
+        assert result.ret
+        payload = read_payload(html)
+        assert payload['summary']['passed'] == 10
+        assert payload['summary']['failed'] == 10
+        tests = payload['results'][0]['test_results']
+        assert [t['nodeid'] for t in tests] == [
+            'test_render_thread.py::test_fail[{0}]'.format(i)
+            for i in range(20)
+        ]
+        for i, test in enumerate(tests):
+            if i % 2 == 0:
+                assert 'failure {0}'.format(i) in payload['logs'][test['log']]
+
+    @pytest.mark.parametrize('args', [[], ['--html-render-thread']])
+    def test_concurrent_reporting(self, testdir, args):
+        # the reports of 200 tests (made the way the plugin sends them up
+        # from where the tests run) are logged from 8 threads at once
+        testdir.makeconftest("""
+            import sys
+            import threading
+            import time
+            import pytest
+            from pytest_html import extras
+
+            report_class = []
+
+            def pytest_runtest_logreport(report):
+                if not report_class:
+                    report_class.append(type(report))
+
+            def make_reports(cls, i, last):
+                report = report_class[0]
+                nodeid = 'test_threads.py::{0}::test_{1}'.format(cls, i)
+                name = '{0}.test_{1}'.format(cls, i)
+                location = ('test_threads.py', i, name)
+                outcome = 'failed' if i % 5 == 0 else 'passed'
+                groups = [
+                    {'name': 'test_threads.py', 'is_test': False},
+                    {'name': cls, 'is_test': False},
+                ]
+                node_chain = groups + [{
+                    'name': 'test_{0}'.format(i),
+                    'is_test': True,
+                    'nodeid': nodeid,
+                    'location': location,
+                    'outcome': outcome.capitalize(),
+                    'duration': 0.01,
+                }]
+                now = time.time()
+                timing = {
+                    'worker': 'master',
+                    'start': now,
+                    'stop': now + 0.03,
+                    'phases': {'setup': 0.01, 'call': 0.01, 'teardown': 0.01},
+                }
+                fixture_durations = [{
+                    'name': 'resource',
+                    'description': '',
+                    'param_index': 0,
+                    'baseid': '',
+                    'scope': 'function',
+                    'setup': 0.001,
+                    'teardown': 0.001,
+                }]
+                teardown = [
+                    ('pytest_html_report_test_timing', timing),
+                    ('pytest_html_report_fixture_durations',
+                     fixture_durations),
+                ]
+                if last:
+                    groups[1]['extra'] = [extras.text('done')]
+                    teardown.append(
+                        ('pytest_html_report_node_extras', groups))
+                return [
+                    report(nodeid, location, {}, 'passed', None, 'setup',
+                           user_properties=[]),
+                    report(nodeid, location, {}, outcome,
+                           'failure {0}'.format(i) if i % 5 == 0 else None,
+                           'call', user_properties=[
+                               ('pytest_html_report_node_chain', node_chain),
+                           ]),
+                    report(nodeid, location, {}, 'passed', None, 'teardown',
+                           user_properties=teardown),
+                ]
+
+            def log_reports(config, start, reports):
+                start.wait()
+                for report in reports:
+                    config.hook.pytest_runtest_logreport(report=report)
+
+            @pytest.hookimpl(tryfirst=True)
+            def pytest_sessionfinish(session):
+                if hasattr(sys, 'setswitchinterval'):
+                    # switch between the threads as often as possible
+                    interval = sys.getswitchinterval()
+                    sys.setswitchinterval(1e-6)
+                reports = [[] for _ in range(8)]
+                for c in range(8):
+                    for i in range(25):
+                        reports[(c * 25 + i) % 8].extend(make_reports(
+                            'Test{0}'.format(c), i, i == 24))
+                start = threading.Event()
+                threads = [
+                    threading.Thread(
+                        target=log_reports, args=(session.config, start, r))
+                    for r in reports
+                ]
+                for t in threads:
+                    t.start()
+                start.set()
+                for t in threads:
+                    t.join()
+                if hasattr(sys, 'setswitchinterval'):
+                    sys.setswitchinterval(interval)
+        """)
+        testdir.makepyfile(test_seed='def test_seed(): pass')
+        result, html = run(testdir, 'report.html', '--self-contained-html',
+                           '--html-compress-payload', *args)
+        table = re.search('<table id="fixture-durations">(.*?)</table>',
+                          html, re.S).group(1)
+        counts = dict(
+            re.findall('<td>([^<]*)</td>', row)[0:5:4]
+            for row in re.findall('<tr>(.*?)</tr>', table, re.S)[1:]
+        )
+        assert counts['resource'] == '200'
+        payload = read_payload(html)
+        assert payload['summary']['passed'] == 161
+        assert payload['summary']['failed'] == 40
+        module, = [m for m in payload['results']
+                   if m['name'] == 'test_threads.py']
+        assert module['summary']['passed'] == 160
+        assert len(module['children']) == 8
+        for cls in module['children']:
+            assert len(cls['test_results']) == 25
+            assert sum(cls['summary'].values()) == 25
+            assert [e['content'] for e in cls['extra']] == ['done']
+            for test in cls['test_results']:
+                if test['outcome'] == 'Failed':
+                    assert 'failure' in payload['logs'][test['log']]
+
+    def test_log_section_limit(self, testdir):
+        testdir.makepyfile("""
+            def test_stdout():
+                print('HEAD' + 'x' * 10000 + 'TAIL')
+        """)
+        result, html = run(testdir, 'report.html',
+                           '--html-log-section-limit', '100')
+        assert result.ret == 0
+        assets_dir = testdir.tmpdir.join('assets')
+        script = assets_dir.join('script.js').read()
+        assert 'HEAD' in script
+        assert 'TAIL' in script
+        assert 'x' * 100 not in script
+        logs = assets_dir.join('logs').listdir()
+        assert len(logs) == 1
+        assert 'HEAD' + 'x' * 10000 + 'TAIL' in logs[0].read()
+        assert 'assets/logs/{0}'.format(logs[0].basename) in script
+
     @pytest.mark.parametrize('result', ['pass', 'fail'])
     def test_stdout(self, testdir, result):
         content = '<spam>ham</spam>'